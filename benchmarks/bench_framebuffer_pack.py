@@ -0,0 +1,57 @@
+"""
+Benchmark of packing a frame into the SSD1306 page format.
+
+Compares the previous path, adafruit_framebuf's FrameBuffer.image() as
+used by adafruit_ssd1306, with the PIL and NumPy framebuffers.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_framebuffer_pack
+"""
+import timeit
+
+import adafruit_framebuf
+from PIL import Image, ImageDraw
+
+from octoprint_ssd1306oleddisplay.framebuffer import (
+    ImageFramebuffer, NumpyFramebuffer, numpy)
+
+NUMBER = 200
+
+
+def frame(width, height):
+    image = Image.new('1', (width, height))
+    draw = ImageDraw.Draw(image)
+    for y in range(0, height, 8):
+        draw.text((0, y), 'B:60ok T0:210+ 42%', fill=1)
+    return image
+
+
+def measure(func):
+    return timeit.timeit(func, number=NUMBER) / NUMBER * 1e6
+
+
+def main():
+    print('{:<8} {:>16} {:>12} {:>12}'.format(
+        'size', 'adafruit (us)', 'PIL (us)', 'NumPy (us)'))
+    for (width, height) in [(128, 32), (128, 64)]:
+        image = frame(width, height)
+        buffer = bytearray((height // 8) * width)
+        adafruit = adafruit_framebuf.FrameBuffer(
+            buffer, width, height, adafruit_framebuf.MVLSB)
+        results = [measure(lambda: adafruit.image(image))]
+        framebuffers = [ImageFramebuffer]
+        if numpy is not None:
+            framebuffers.append(NumpyFramebuffer)
+        for framebuffer in framebuffers:
+            fb = framebuffer(width, height)
+            fb.blit(fb.strip(image), 0)
+            view = memoryview(buffer)
+            results.append(measure(lambda: fb.pack(view)))
+        results += [float('nan')] * (3 - len(results))
+        print('{:<8} {:>16.1f} {:>12.1f} {:>12.1f}'.format(
+            '{}x{}'.format(width, height), *results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Micro-benchmark of the overhead protocol_gcode_sent_hook adds to every
+line OctoPrint sends to the printer.
+
+Compares the previous hook, which formatted M117 messages inline on the
+serial thread, with the current one that hands them to the display thread.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_gcode_sent_hook
+"""
+import logging
+import textwrap
+import timeit
+
+from octoprint_ssd1306oleddisplay import Ssd1306_oled_displayPlugin
+from octoprint_ssd1306oleddisplay.SSD1306 import SSD1306
+
+NUMBER = 100000
+
+
+class Settings:
+    values = Ssd1306_oled_displayPlugin().get_settings_defaults()
+
+    def get(self, path):
+        return self.values[path[0]]
+
+    def get_int(self, path):
+        return int(self.values[path[0]])
+
+    def get_float(self, path):
+        return float(self.values[path[0]])
+
+
+def legacy_hook(self, comm_instance, phase, cmd, cmd_type, gcode, *args, **kwargs):
+    """ The hook as it was before M117 handling moved to the display thread. """
+    if (gcode is not None) and (gcode == 'M117'):
+        self._logger.debug('Intercepted M117 gcode: {}'.format(cmd))
+        lines = textwrap.fill(
+            text=' '.join(cmd.split(' ')[1:]),
+            width=self._settings.get(
+                ['width'])/self._settings.get(['fontsize']),
+            max_lines=1
+        ).split('\n')
+        self._logger.debug('Split message: "%s"', lines)
+        for i in range(0, len(lines)):
+            self.display.write_row(1+i, lines[i] if i < len(lines) else '')
+        self.display.commit()
+
+
+def create_plugin():
+    plugin = Ssd1306_oled_displayPlugin()
+    plugin._settings = Settings()
+    plugin._logger = logging.getLogger('benchmark')
+    plugin._apply_settings()
+    # Display thread is not started, queued calls are dropped by the
+    # bounded queue instead of being run.
+    plugin.display = SSD1306(logger=plugin._logger)
+    return plugin
+
+
+def measure(hook, plugin, cmd, gcode):
+    seconds = timeit.timeit(
+        lambda: hook(plugin, None, 'sent', cmd, None, gcode), number=NUMBER)
+    return seconds / NUMBER * 1e9
+
+
+def main():
+    plugin = create_plugin()
+    current = Ssd1306_oled_displayPlugin.protocol_gcode_sent_hook
+    print('{:<12} {:>12} {:>12}'.format('line', 'before (ns)', 'after (ns)'))
+    for (cmd, gcode) in [
+        ('G1 X10 Y10 E0.5', 'G1'),
+        ('M117 Layer 12 of 240', 'M117'),
+    ]:
+        print('{:<12} {:>12.0f} {:>12.0f}'.format(
+            gcode,
+            measure(legacy_hook, plugin, cmd, gcode),
+            measure(current, plugin, cmd, gcode),
+        ))
+
+
+if __name__ == '__main__':
+    main()
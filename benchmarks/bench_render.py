@@ -0,0 +1,54 @@
+"""
+Benchmark of frames per second and bytes on the wire, using the in-memory
+fake display backend with simulated bus speeds. No hardware is needed.
+
+Each frame updates the temperature row, every tenth frame also the
+progress row, like during a print.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_render
+"""
+import logging
+from time import perf_counter
+
+from octoprint_ssd1306oleddisplay.backends import FakeBackend
+from octoprint_ssd1306oleddisplay.SSD1306 import SSD1306
+
+FRAMES = 200
+
+
+def run(width, height, khz):
+    backend = FakeBackend(width, height, khz=khz)
+    display = SSD1306(width=width, height=height, backend=backend,
+                      logger=logging.getLogger('benchmark'))
+    display._init_display()
+    rows = {0: 'pCat', 1: 'Printing', 2: 'B:60ok T0:210ok', 3: '0% 1h 30m'}
+    display._draw_rows(rows)
+    display._send_image()
+    backend.bytes_sent = 0
+    start = perf_counter()
+    for i in range(FRAMES):
+        rows = {2: 'B:60ok T0:{}+'.format(150 + i % 60)}
+        if i % 10 == 0:
+            rows[3] = '{}% 1h {}m'.format(i // 10, 30 - i // 10)
+        display._draw_rows(rows)
+        display._send_image()
+    elapsed = perf_counter() - start
+    return (FRAMES / elapsed, backend.bytes_sent / FRAMES)
+
+
+def main():
+    print('{:<8} {:>6} {:>10} {:>14}'.format(
+        'size', 'kHz', 'frames/s', 'bytes/frame'))
+    for (width, height) in [(128, 32), (128, 64)]:
+        for khz in (100, 400, 1000, 0):
+            (fps, per_frame) = run(width, height, khz)
+            print('{:<8} {:>6} {:>10.0f} {:>14.0f}'.format(
+                '{}x{}'.format(width, height), khz or 'inf', fps, per_frame))
+    print('Full frame: {} bytes for 128x32, {} bytes for 128x64'.format(
+        128 * 4 + 1, 128 * 8 + 1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+"""
+Replays a recorded print against the plugin, with a fake clock and the
+in-memory fake display backend, as fast as possible. Reports CPU time per
+callback, frames and bytes sent, and compares a checksum of every frame
+sent with golden checksums, so that a change in what the display shows
+is caught together with a change in speed.
+
+Record a print by setting `recordfile` in OctoPrint's config.yaml, the
+recording is written until OctoPrint is stopped:
+
+    plugins:
+      ssd1306_oled_display:
+        recordfile: /home/pi/print.jsonl.gz
+
+Run from the repository root, with a recording or a synthetic print:
+
+    python -m benchmarks.bench_replay /home/pi/print.jsonl.gz
+    python -m benchmarks.bench_replay --synthetic /tmp/synthetic.jsonl.gz
+
+Checksums are stored with --update-golden, next to the recording by
+default, and compared on later runs. Settings can be changed with e.g.
+`--set 'layout="{title}\\n{progressbar}"'`, values are JSON.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import zlib
+from time import process_time
+
+import octoprint_ssd1306oleddisplay.SSD1306 as ssd1306
+from octoprint_ssd1306oleddisplay import Ssd1306_oled_displayPlugin
+from octoprint_ssd1306oleddisplay.backends import FakeBackend
+from octoprint_ssd1306oleddisplay.recording import Recorder, read_recording
+
+# Rendering done by the display thread, reported with the callbacks.
+RENDER = 'render (display thread)'
+
+
+class FakeClock:
+    """ Time in seconds, only advanced by the replay. """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Settings:
+    def __init__(self, **values):
+        self.values = Ssd1306_oled_displayPlugin().get_settings_defaults()
+        self.values.update(values)
+
+    def get(self, path):
+        return self.values[path[0]]
+
+    def get_int(self, path):
+        return int(self.values[path[0]])
+
+    def get_float(self, path):
+        value = self.values[path[0]]
+        return None if value is None else float(value)
+
+    def get_boolean(self, path):
+        return bool(self.values[path[0]])
+
+
+def create_plugin(clock, settings):
+    """ Plugin showing the first panel on a fake display, nothing is started. """
+    plugin = Ssd1306_oled_displayPlugin()
+    plugin._settings = Settings(**settings)
+    plugin._logger = logging.getLogger('benchmark')
+    plugin._temperatures._clock = clock
+    plugin._apply_settings()
+    if plugin._sparkline is not None:
+        plugin._sparkline._clock = clock
+    panel = plugin._panels[0]
+    panel.display = ssd1306.SSD1306(
+        width=int(panel.settings['width']),
+        height=int(panel.settings['height']),
+        fontsize=int(panel.settings['fontsize']),
+        refresh_rate=int(panel.settings['refreshrate']),
+        logger=plugin._logger,
+        backend=FakeBackend(int(panel.settings['width']), int(panel.settings['height'])),
+        dim_after=plugin._settings.get_int(['dimafter']),
+        off_after=plugin._settings.get_int(['offafter']),
+        scroll_rate=plugin._settings.get_int(['scrollrate']),
+        clock=clock,
+    )
+    plugin.display = panel.display
+    plugin.display._init_display()
+    plugin._show_page(panel, 0)
+    return plugin
+
+
+class Replay:
+    """
+    Calls the recorded callbacks and does the work of the display thread
+    in between, one step of its loop (see SSD1306.run) at each fake time
+    it would wake up.
+    """
+
+    def __init__(self, settings):
+        self.clock = FakeClock()
+        self.plugin = create_plugin(self.clock, settings)
+        self.display = self.plugin.display
+        self.page_interval = max(1, self.plugin._settings.get_float(['pageinterval']))
+        self.next_page = None
+        if len(self.plugin._panels[0].layout.pages) > 1:
+            self.next_page = self.page_interval
+        # Callback name to [calls, CPU seconds, longest].
+        self.cpu = {}
+        # (seconds, checksum) of each frame sent.
+        self.frames = []
+
+    def _measure(self, name, func, *args):
+        start = process_time()
+        func(*args)
+        elapsed = process_time() - start
+        stats = self.cpu.setdefault(name, [0, 0, 0])
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+
+    def run(self, path):
+        for (seconds, method, args) in read_recording(path):
+            self.advance(seconds)
+            self._measure(method, getattr(self.plugin, method), *args)
+            # M117 messages are shown by the display thread.
+            if self.display._calls:
+                self._measure(RENDER, self.display._run_calls)
+        # Let the last frames through.
+        self.advance(self.clock.now + 1)
+
+    def _next_due(self):
+        """ Time the display thread next has something to do, None if never. """
+        display = self.display
+        due = []
+        if self.next_page is not None:
+            due.append(self.next_page)
+        if display._has_work():
+            due.append(self.clock.now)
+        else:
+            delay = display._wait_delay()
+            if delay is not None:
+                due.append(self.clock.now + delay)
+        return max(self.clock.now, min(due)) if due else None
+
+    def advance(self, until):
+        """ Do the display thread's work due up to `until`. """
+        display = self.display
+        while True:
+            at = self._next_due()
+            if at is None or at > until:
+                break
+            self.clock.now = at
+            if self.next_page is not None and at >= self.next_page:
+                self.next_page += self.page_interval
+                self._measure(RENDER, self.plugin._next_page)
+                continue
+            if not display._has_work():
+                # Due time rounded down, try again a bit later.
+                self.clock.now += 1e-6
+                continue
+            sent = display._frames_sent
+            self._measure(RENDER, display._step)
+            if display._frames_sent != sent:
+                self.frames.append((at, zlib.crc32(display._sent_buffer)))
+        self.clock.now = max(self.clock.now, until)
+
+
+def synthesize(path, minutes=30):
+    """ Record a synthetic print: heat up, print with progress, M117 per layer. """
+    clock = FakeClock()
+    recorder = Recorder(path, clock=clock)
+    recorder.event('PrinterStateChanged', dict(state_id='PRINTING', state_string='Printing'))
+    duration = minutes * 60
+    layers = minutes
+    for tick in range(duration * 50):
+        # One line sent every 20 ms.
+        clock.now = tick / 50
+        seconds = tick // 50
+        if tick % 50 == 0 and seconds % 60 == 0:
+            layer = seconds // 60 + 1
+            recorder.gcode_sent('M117 Layer {} of {}'.format(layer, layers), 'M117')
+        else:
+            recorder.gcode_sent('G1 X10 Y10 E0.5', 'G1')
+        if tick % 25 == 0:
+            completion = 100 * clock.now / duration
+            recorder.current_data(dict(
+                progress=dict(completion=completion, printTimeLeft=duration - clock.now),
+                state=dict(flags=dict(printing=True))))
+        if tick % 100 == 0:
+            heating = min(1, clock.now / 120)
+            recorder.temperature(dict(
+                bed=dict(actual=20 + 40 * heating + 0.4 * math.sin(tick / 300), target=60),
+                tool0=dict(actual=20 + 190 * heating + 1.5 * math.sin(tick / 70), target=210),
+            ))
+    clock.now = duration
+    recorder.event('PrinterStateChanged', dict(state_id='OPERATIONAL', state_string='Operational'))
+    recorder.close()
+
+
+def report(replay, path):
+    display = replay.display
+    print('Recording: {}, {:.0f} s'.format(path, replay.clock.now))
+    print('{:<30} {:>8} {:>10} {:>10} {:>10}'.format(
+        'callback', 'calls', 'total ms', 'mean us', 'max us'))
+    for (name, (calls, seconds, longest)) in sorted(replay.cpu.items()):
+        print('{:<30} {:>8} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+            name, calls, seconds * 1e3, seconds / calls * 1e6, longest * 1e6))
+    stats = display.get_stats()
+    print('Frames: {} sent, {} rendered, {} scrolled, {} skipped'.format(
+        len(replay.frames), stats['frames_rendered'], stats['frames_scrolled'],
+        stats['frames_skipped']))
+    print('Bytes sent: {}'.format(stats['bytes_sent']))
+
+
+def compare(frames, golden):
+    """ Index of the first frame that differs from `golden`, None if all match. """
+    for (i, (frame, expected)) in enumerate(zip(frames, golden)):
+        if frame != expected:
+            return i
+    if len(frames) != len(golden):
+        return min(len(frames), len(golden))
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('recording', nargs='?', help='file written by the plugin')
+    parser.add_argument('--synthetic', metavar='PATH',
+                        help='write a synthetic print to PATH and replay it')
+    parser.add_argument('--golden', help='golden checksums, default <recording>.golden.json')
+    parser.add_argument('--update-golden', action='store_true',
+                        help='store checksums of this run as golden')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=JSON',
+                        help='plugin setting, e.g. refreshrate=2')
+    args = parser.parse_args()
+    path = args.recording
+    if args.synthetic:
+        synthesize(args.synthetic)
+        path = args.synthetic
+    if not path:
+        parser.error('a recording or --synthetic is required')
+    settings = {}
+    for setting in args.set:
+        (key, value) = setting.split('=', 1)
+        settings[key] = json.loads(value)
+
+    replay = Replay(settings)
+    replay.run(path)
+    report(replay, path)
+
+    frames = [[round(seconds * 1000), checksum] for (seconds, checksum) in replay.frames]
+    golden_path = args.golden or path + '.golden.json'
+    if args.update_golden:
+        with open(golden_path, 'w') as f:
+            json.dump(dict(settings=settings, frames=frames), f)
+        print('Golden checksums written to {}'.format(golden_path))
+    elif os.path.exists(golden_path):
+        with open(golden_path) as f:
+            golden = json.load(f)
+        if golden['settings'] != settings:
+            print('Not compared, {} was stored with settings {}'.format(
+                golden_path, golden['settings']))
+            return
+        mismatch = compare(frames, golden['frames'])
+        if mismatch is not None:
+            print('Frame {} differs from {}, at {:.3f} s'.format(
+                mismatch, golden_path, frames[min(mismatch, len(frames) - 1)][0] / 1000))
+            sys.exit(1)
+        print('All {} frames match {}'.format(len(frames), golden_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,42 @@
 import copy
 import threading
+from collections import deque
+from contextlib import nullcontext
 from logging import DEBUG, ERROR, INFO, WARN
-from time import sleep
+from time import monotonic, perf_counter
 
-import adafruit_ssd1306
-import busio
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageFont
 
-from octoprint_ssd1306oleddisplay.helpers import find_resource
-
-try:
-    from board import SCL, SDA
-except:
-    pass
+from octoprint_ssd1306oleddisplay.backends import (SET_COL_ADDR,
+                                                   SET_CONTRAST, SET_DISP,
+                                                   SET_PAGE_ADDR, I2CBackend)
+from octoprint_ssd1306oleddisplay.cache import LRUCache
+from octoprint_ssd1306oleddisplay.framebuffer import create_framebuffer
+from octoprint_ssd1306oleddisplay.glyphs import GlyphAtlas
+from octoprint_ssd1306oleddisplay.helpers import changed_columns, changed_windows, find_resource
+from octoprint_ssd1306oleddisplay.stats import Histogram
 
 # from octoprint_ssd1306display.helpers import find_resource
 
+# Display health states.
+STATE_DOWN = 'down'
+STATE_UP = 'up'
+# Display power states, see wake.
+POWER_ON = 'on'
+POWER_DIM = 'dim'
+POWER_OFF = 'off'
+# Contrast set by the driver on initialization.
+FULL_CONTRAST = 0xFF
+# Space between the end and the repeated start of scrolling text.
+MARQUEE_GAP = '   '
+
 
 class SSD1306(threading.Thread):
-    _lock = threading.Lock()
-    _stop = False
+    _stopping = False
     daemon = True
     _rows = []
     _committed_rows = []
+    _dirty = set()
 
     def __init__(
         self,
@@ -31,6 +45,18 @@ class SSD1306(threading.Thread):
         fontsize=8,
         refresh_rate=1,
         logger=None,
+        row_cache_size=32,
+        use_numpy=None,
+        backend=None,
+        retry_min=1,
+        retry_max=300,
+        dim_after=0,
+        off_after=0,
+        dim_contrast=0x10,
+        scroll_rate=8,
+        scroll_step=4,
+        bus=None,
+        clock=monotonic,
     ):
         super(SSD1306, self).__init__()
 
@@ -40,29 +66,202 @@ class SSD1306(threading.Thread):
         self._fontsize = fontsize
         self._y_offset = 0
         self._logger = logger
+        # Time in seconds for idle timeouts, scrolling and the frame rate.
+        self._clock = clock
+        # Maximum number of frames per second.
         self._refresh_rate = refresh_rate
+        # Signalled on commit and stop, wakes the render thread.
+        self._lock = threading.Condition()
+        # Held while drawing and sending a frame, see reconfigure.
+        self._render_lock = threading.Lock()
+        self._last_frame = 0
+        # Functions to run on the render thread, see call_soon. Bounded so
+        # that a thread that is not running cannot grow it without limit.
+        self._calls = deque(maxlen=64)
         # self._font = ImageFont.load_default()
         self._font = ImageFont.truetype(find_resource(
             'font/PressStart2P.ttf'), self._fontsize)
-        self._image = Image.new('1', (self._width, self._height))
-        self._draw = ImageDraw.Draw(self._image)
+        self._atlas = GlyphAtlas(self._font, self._fontsize)
+        # NumPy framebuffer if installed, unless `use_numpy` is set.
+        self._use_numpy = use_numpy
+        self._framebuffer = create_framebuffer(
+            self._width, self._height, use_numpy)
+        # Rendered row strips, keyed by (text, fontsize, width).
+        self._row_cache = LRUCache(row_cache_size)
         # Start with the same number of rows as set by dimensions.
         self._rows = [''] * round(self._height/self._fontsize)
+        self._committed_rows = [''] * len(self._rows)
+        # Rows changed since last rendered frame, and commit generations.
+        self._dirty = set()
+        self._generation = 0
+        self._sent_generation = 0
+        self._frames_rendered = 0
+        self._frames_skipped = 0
+        # Time of the first commit not yet shown, for commit-to-visible latency.
+        self._commit_time = None
+        self._bus_errors = 0
+        self._timings = dict(
+            compose=Histogram(),
+            pack=Histogram(),
+            transfer=Histogram(),
+            latency=Histogram(),
+        )
+        # Frame in SSD1306 page format, and the last one sent.
+        self._pages = self._height // 8
+        self._buffer = bytearray(self._pages * self._width)
+        self._sent_buffer = None
+        # Last frame sent, see get_frame.
+        self._frames_sent = 0
+        self._frame = None
 
-        try:
-            i2c = busio.I2C(SCL, SDA)
-            self._display = adafruit_ssd1306.SSD1306_I2C(
-                self._width,
-                self._height,
-                i2c,
-            )
-            self.log('Display initialized', level=DEBUG)
-        except:
-            self.log('Failed to initialize display', level=WARN)
+        # I2C display unless another backend is given. Hardware is
+        # initialized when the thread starts.
+        if backend is None:
+            backend = I2CBackend(self._width, self._height)
+        self._backend = backend
+        # Bus shared with other displays, transfers wait for their turn
+        # there (see bus.Bus). Frames with urgent rows go first and are not
+        # held back by `refresh_rate`.
+        self._bus = bus
+        self._urgent = False
+        # While the display is down nothing is rendered, initialization is
+        # retried with exponential backoff between `retry_min` and
+        # `retry_max` seconds.
+        self._state = STATE_DOWN
+        self._retry_min = retry_min
+        self._retry_max = retry_max
+        self._backoff = retry_min
+        self._retry_at = 0
+        self._reconnects = 0
+        # Set after the first successful initialization, later ones are
+        # counted as reconnects.
+        self._was_up = False
+        # Set when a full frame should be sent even without a new commit.
+        self._redraw = False
+        # Contrast is lowered `dim_after` seconds and the display turned off
+        # `off_after` seconds after the last wake, 0 to disable. No frames
+        # are sent while the display is off.
+        self._dim_after = dim_after
+        self._off_after = off_after
+        self._dim_contrast = dim_contrast
+        self._active_time = self._clock()
+        self._power = POWER_ON
+        # Rows too long for the display scroll `scroll_step` pixels
+        # `scroll_rate` times per second, independent of `refresh_rate`
+        # (0 stops scrolling).
+        # Maps row index to (strip, period, offset), see _draw_rows.
+        self._scroll_rate = scroll_rate
+        self._scroll_step = scroll_step
+        self._scroll_at = 0
+        self._marquees = {}
+        self._frames_scrolled = 0
+        # Graphic rows as last drawn, only changed columns are drawn again.
+        self._graphics = {}
 
         self.log(
             'Width: {}, height: {}'.format(self._width, self._height), level=DEBUG)
 
+    def _init_display(self):
+        """
+        Initialize display, backends keep their bus handle if already open.
+        On success everything is redrawn, on failure a retry is scheduled.
+        Called with render lock held, reconfigure may not replace the
+        backend meanwhile.
+        """
+        self._backend.width = self._width
+        self._backend.height = self._height
+        try:
+            with self._transfer(urgent=True):
+                self._backend.open()
+        except:
+            self._set_down('Failed to initialize display')
+            return False
+        with self._lock:
+            self._state = STATE_UP
+            self._backoff = self._retry_min
+            if self._was_up:
+                self._reconnects += 1
+            self._was_up = True
+            # Initialization turns the display on at full contrast.
+            self._power = POWER_ON
+            # Redraw and resend everything.
+            self._dirty = set(range(len(self._committed_rows)))
+            self._sent_buffer = None
+            self._redraw = True
+        self.log('Display initialized', level=DEBUG)
+        return True
+
+    def _set_down(self, message):
+        """ Stop rendering and schedule a new initialization attempt. """
+        with self._lock:
+            if self._state == STATE_UP:
+                self.log(message, level=WARN)
+            else:
+                self.log(message, level=DEBUG)
+            self._state = STATE_DOWN
+            self._retry_at = self._clock() + self._backoff
+            self._backoff = min(self._backoff * 2, self._retry_max)
+
+    def reconfigure(self, width=None, height=None, fontsize=None, refresh_rate=None, backend=None,
+                    dim_after=None, off_after=None, scroll_rate=None):
+        """
+        Change display parameters, only rebuilding what is affected.
+        Rows are kept (truncated or padded to the new row count) and the
+        whole display is redrawn with the next frame.
+        A new `backend` replaces the current one.
+        """
+        width = self._width if width is None else width
+        height = self._height if height is None else height
+        fontsize = self._fontsize if fontsize is None else fontsize
+        resized = (width, height) != (self._width, self._height)
+        refont = fontsize != self._fontsize
+        with self._render_lock, self._lock:
+            if refresh_rate is not None:
+                self._refresh_rate = refresh_rate
+            if dim_after is not None:
+                self._dim_after = dim_after
+            if off_after is not None:
+                self._off_after = off_after
+            if scroll_rate is not None:
+                self._scroll_rate = scroll_rate
+            # Idle timeouts may have changed.
+            self._lock.notify()
+            if resized or backend is not None:
+                if backend is not None:
+                    backend.take_over(self._backend)
+                    self._backend = backend
+                # Initialized again by the render thread.
+                self._state = STATE_DOWN
+                self._backoff = self._retry_min
+                self._retry_at = 0
+            if not (resized or refont or backend):
+                return
+            self._width = width
+            self._height = height
+            self._fontsize = fontsize
+            if refont:
+                self._font = ImageFont.truetype(find_resource(
+                    'font/PressStart2P.ttf'), self._fontsize)
+                self._atlas = GlyphAtlas(self._font, self._fontsize)
+                self._row_cache.clear()
+            self._framebuffer = create_framebuffer(
+                self._width, self._height, self._use_numpy)
+            self._pages = self._height // 8
+            self._buffer = bytearray(self._pages * self._width)
+            # Scrolling and graphic rows are set up again when redrawn.
+            self._marquees = {}
+            self._graphics = {}
+            count = round(self._height/self._fontsize)
+            self._rows = (self._rows + [''] * count)[:count]
+            self._committed_rows = (self._committed_rows + [''] * count)[:count]
+            # Redraw and resend everything.
+            self._dirty = set(range(count))
+            self._sent_buffer = None
+            self._redraw = True
+            self._lock.notify()
+        self.log('Reconfigured, width: {}, height: {}, fontsize: {}'.format(
+            self._width, self._height, self._fontsize), level=DEBUG)
+
     # Clear content.
     def clear_rows(self, start=None, end=None):
         """
@@ -115,37 +314,426 @@ class SSD1306(threading.Thread):
     def commit(self):
         """ Send data to be shown on the display. """
         with self._lock:
-            self._committed_rows = copy.copy(self._rows)
-        self.log(self._committed_rows, level=DEBUG)
+            changed = [r for (r, text) in enumerate(self._rows)
+                       if self._committed_rows[r] != text]
+            if changed:
+                self._committed_rows = copy.copy(self._rows)
+                self._mark_changed(changed)
+        if changed:
+            self.log(self._committed_rows, level=DEBUG)
+
+    def update_rows(self, rows, clear=False, urgent=False):
+        """
+        Write and commit several rows at once, `rows` maps row index to text.
+        Text may also be bytes with the columns of a graphic, each column
+        `(fontsize + 7) // 8` bytes with the top pixel in the most
+        significant bit (see Sparkline). All rows are shown in the same frame. Other rows written with
+        `write_row` are not committed. If `clear` is set, rows not in
+        `rows` are cleared. If `urgent` is set, e.g. for errors, the rows
+        are shown without waiting for the refresh rate or other displays
+        on the same bus.
+        """
+        with self._lock:
+            # Check all rows first so nothing is written on error.
+            for row in rows:
+                if not 0 <= row < len(self._rows):
+                    self.log('Row index too large, {} > {}'.format(
+                        row, len(self._rows)), level=INFO)
+                    raise IndexError('Row index out of range, got {} but should be in range(0, {})'.format(
+                        row, len(self._rows)))
+            if clear:
+                cleared = dict.fromkeys(range(len(self._rows)), '')
+                cleared.update(rows)
+                rows = cleared
+            changed = []
+            for (r, text) in rows.items():
+                self._rows[r] = text
+                if self._committed_rows[r] != text:
+                    self._committed_rows[r] = text
+                    changed.append(r)
+            if changed:
+                self._urgent = self._urgent or urgent
+                self._mark_changed(changed)
+        if changed:
+            self.log({r: rows[r] for r in changed}, level=DEBUG)
+
+    def _mark_changed(self, rows):
+        """ Schedule changed rows for the next frame, called with lock held. """
+        self._dirty.update(rows)
+        self._generation += 1
+        if self._commit_time is None:
+            self._commit_time = perf_counter()
+        self._lock.notify()
+
+    def call_soon(self, func, *args):
+        """
+        Run `func(*args)` on the render thread. Safe to call from any thread,
+        only appends to a queue and wakes the render thread.
+        """
+        self._calls.append((func, args))
+        with self._lock:
+            self._lock.notify()
+
+    def _run_calls(self):
+        """ Run functions queued by call_soon. """
+        while self._calls:
+            (func, args) = self._calls.popleft()
+            try:
+                func(*args)
+            except Exception as e:
+                self.log('Queued call failed: {}'.format(e), level=WARN)
 
     def run(self):
         """ Loop that update what is shown on the display """
-        while not self._stop:
+        while True:
             with self._lock:
-                rows = copy.copy(self._committed_rows)
-            # Clear display
-            self._draw.rectangle((0, 0, self._width, self._height), fill=0)
-            # Draw text on image
-            for (r, text) in enumerate(rows):
-                self._draw.text(
-                    (0, r * self._fontsize + self._y_offset), text, font=self._font, fill=200)
-            try:
-                self._display.image(self._image)  # Send image to display
-                self._display.show()  # Show
-            except:
-                # self._image.save('test/img.png')
-                self.log('Failed to send to display', level=DEBUG)
-            sleep(1/self._refresh_rate)
+                # Sleep until something is committed, a retry, idle timeout
+                # or frame is due or the thread is stopped. The timeout is
+                # computed again after each wake, reconfigure may change it.
+                if not self._has_work():
+                    self._lock.wait(self._wait_delay())
+                    continue
+                if self._stopping:
+                    break
+            self._run_calls()
+            self._step()
+
+    def _step(self):
+        """
+        Do the render loop's work that is due: initialize the display,
+        change its power or draw and send a frame.
+        """
+        if self._state != STATE_UP:
+            if self._clock() >= self._retry_at:
+                with self._render_lock:
+                    self._init_display()
+            return
+        power = self._idle_power()
+        if power != self._power:
+            with self._render_lock:
+                self._set_power(power)
+            return
+        if self._power == POWER_OFF:
+            return
+        with self._lock:
+            # Limit frame rate, commits arriving meanwhile share a frame.
+            frame = self._frame_pending() and not self._frame_delay()
+            if frame:
+                (generation, rows, urgent) = self._take_frame()
+        if frame:
+            self._last_frame = self._clock()
+            with self._render_lock:
+                self._render(generation, rows, urgent)
+        elif self._scroll_due():
+            # Only scrolling rows changed.
+            with self._render_lock:
+                self._render(None, {})
+
+    def _take_frame(self):
+        """
+        Rows to draw for the next frame as `(generation, rows, urgent)`,
+        see _render. Called with lock held.
+        """
+        generation = self._generation
+        dirty = self._dirty
+        self._dirty = set()
+        self._redraw = False
+        urgent = self._urgent
+        self._urgent = False
+        return (generation, {r: self._committed_rows[r] for r in dirty}, urgent)
+
+    def _has_work(self):
+        if self._stopping or self._calls:
+            return True
+        if self._state == STATE_UP:
+            if self._idle_power() != self._power:
+                return True
+            # Commits are kept but not rendered while the display is off.
+            return self._power != POWER_OFF and (
+                (self._frame_pending() and not self._frame_delay())
+                or self._scroll_due())
+        # Commits are not rendered while the display is down.
+        return self._clock() >= self._retry_at
+
+    def _frame_pending(self):
+        return self._redraw or self._generation != self._sent_generation
+
+    def _frame_delay(self):
+        """ Seconds until the refresh rate allows the next frame, 0 for urgent frames. """
+        if self._urgent:
+            return 0
+        return max(0, self._last_frame + 1/self._refresh_rate - self._clock())
+
+    def _scroll_due(self):
+        return (bool(self._marquees) and self._scroll_rate > 0
+                and self._clock() >= self._scroll_at)
+
+    def _wait_delay(self):
+        """
+        Seconds until the next initialization attempt if down, or until the
+        next idle power change, pending frame or scroll step if up. None if
+        there is nothing to wait for.
+        """
+        now = self._clock()
+        if self._state != STATE_UP:
+            return max(0, self._retry_at - now)
+        idle = now - self._active_time
+        delays = [t - idle for t in (self._dim_after, self._off_after)
+                  if t and t > idle]
+        if self._marquees and self._scroll_rate and self._power != POWER_OFF:
+            delays.append(max(0, self._scroll_at - now))
+        if self._frame_pending() and self._power != POWER_OFF:
+            delays.append(self._frame_delay())
+        return min(delays) if delays else None
+
+    def _idle_power(self):
+        """ Power state for the time since the last wake. """
+        idle = self._clock() - self._active_time
+        if self._off_after and idle >= self._off_after:
+            return POWER_OFF
+        if self._dim_after and idle >= self._dim_after:
+            return POWER_DIM
+        return POWER_ON
+
+    def _set_power(self, power):
+        """ Dim, turn off or wake the display, runs on the render thread. """
+        try:
+            with self._transfer():
+                if power == POWER_OFF:
+                    self._backend.command(SET_DISP)
+                else:
+                    if self._power == POWER_OFF:
+                        self._backend.command(SET_DISP | 1)
+                    self._backend.command(SET_CONTRAST, self._dim_contrast
+                                          if power == POWER_DIM else FULL_CONTRAST)
+        except:
+            self._bus_errors += 1
+            self._set_down('Failed to set display power')
+            return
+        self._power = power
+        self.log('Display power: {}'.format(power), level=DEBUG)
+
+    def wake(self):
+        """
+        Restart the idle timeout, turns the display back on if it was
+        dimmed or off. Safe to call from any thread.
+        """
+        with self._lock:
+            self._active_time = self._clock()
+            self._lock.notify()
+
+    def _render(self, generation, rows, urgent=False):
+        """
+        Draw rows and send the frame to the display. Scrolling rows are
+        moved if a step is due, `generation` is None if only they changed.
+        """
+        # Rows may have been removed by reconfigure since they were read.
+        rows = {r: text for (r, text) in rows.items() if r < len(self._rows)}
+        start = perf_counter()
+        try:
+            self._draw_rows(rows)
+            scrolled = self._scroll_due()
+            if scrolled:
+                self._scroll()
+        except Exception as e:
+            self.log('Failed to draw rows: {}'.format(e), level=WARN)
+            with self._lock:
+                # Set up again and redraw everything with the next frame.
+                self._marquees = {}
+                self._graphics = {}
+                self._dirty = set(range(len(self._committed_rows)))
+                self._redraw = True
+            return
+        self._timings['compose'].record(perf_counter() - start)
+        try:
+            self._send_image(urgent)
+            if scrolled:
+                self._frames_scrolled += 1
+            if generation is None:
+                return
+            # Generations merged into this frame were never shown.
+            self._frames_skipped += max(0, generation - self._sent_generation - 1)
+            self._sent_generation = generation
+            self._frames_rendered += 1
+            with self._lock:
+                if self._commit_time is not None:
+                    self._timings['latency'].record(
+                        perf_counter() - self._commit_time)
+                    self._commit_time = None
+        except:
+            self._bus_errors += 1
+            # Everything is redrawn when the display is back.
+            self._set_down('Failed to send to display')
+
+    def _send_image(self, urgent=False):
+        """ Send only the pages and columns that changed since last frame. """
+        if self._state != STATE_UP:
+            raise IOError('Display not initialized')
+        buffer = memoryview(self._buffer)
+        start = perf_counter()
+        self._framebuffer.pack(buffer)
+        packed = perf_counter()
+        self._timings['pack'].record(packed - start)
+        if self._sent_buffer is None:
+            # Full frame
+            with self._transfer(urgent):
+                self._write_window(0, self._pages - 1, 0, self._width - 1, buffer)
+        else:
+            windows = changed_windows(
+                self._sent_buffer, buffer, self._width, self._pages)
+            if windows:
+                # The whole frame in one turn on the bus.
+                with self._transfer(urgent):
+                    for (page, first, last) in windows:
+                        start = page * self._width
+                        self._write_window(
+                            page, page, first, last, buffer[start + first:start + last + 1])
+        self._sent_buffer = bytes(buffer)
+        self._frames_sent += 1
+        self._frame = (self._frames_sent, self._width, self._height, self._sent_buffer)
+        self._timings['transfer'].record(perf_counter() - packed)
+
+    def _transfer(self, urgent=False):
+        """ Context for a transfer, waits for the shared bus if there is one. """
+        if self._bus is None:
+            return nullcontext()
+        return self._bus.transfer(urgent)
+
+    def _write_window(self, first_page, last_page, first, last, data):
+        """ Write `data` to columns `first` to `last` of pages `first_page` to `last_page`. """
+        offset = 0
+        if self._width != 128:
+            # Narrow displays use centered columns
+            offset = (128 - self._width) // 2
+        self._backend.command(
+            SET_COL_ADDR, first + offset, last + offset,
+            SET_PAGE_ADDR, first_page, last_page,
+        )
+        self._backend.data(data)
+
+    def _draw_rows(self, rows):
+        """
+        Redraw only the given rows, `rows` maps row index to text.
+        Text wider than the display starts scrolling from the beginning.
+        Bytes are drawn as graphic columns, see update_rows.
+        """
+        for (r, text) in rows.items():
+            y = r * self._fontsize + self._y_offset
+            if isinstance(text, bytes):
+                self._marquees.pop(r, None)
+                self._draw_graphic(r, y, text)
+                continue
+            self._graphics.pop(r, None)
+            if self._atlas.text_width(text) <= self._width:
+                self._marquees.pop(r, None)
+                self._framebuffer.blit(self._row_strip(text), y)
+                continue
+            (strip, period) = self._marquee_strip(text)
+            if not self._marquees:
+                # Show the beginning for one step before scrolling.
+                self._scroll_at = self._clock() + 1/max(1, self._scroll_rate)
+            self._marquees[r] = (strip, period, 0)
+            self._framebuffer.blit(
+                self._framebuffer.window(strip, 0, self._width), y)
+
+    def _draw_graphic(self, row, y, columns):
+        """ Draw a graphic row, only the columns that changed since it was last drawn. """
+        previous = self._graphics.get(row)
+        self._graphics[row] = columns
+        stride = (self._fontsize + 7) // 8
+        if previous is None or len(previous) != len(columns):
+            span = (0, len(columns) // stride)
+        else:
+            span = changed_columns(previous, columns, stride)
+            if span is None:
+                return
+        (first, end) = span
+        self._framebuffer.blit(self._framebuffer.graphic(
+            columns[first * stride:end * stride], self._fontsize), y, first)
+
+    def _scroll(self):
+        """ Move scrolling rows one step, using their cached strips. """
+        for (r, (strip, period, offset)) in self._marquees.items():
+            offset = (offset + self._scroll_step) % period
+            self._marquees[r] = (strip, period, offset)
+            self._framebuffer.blit(
+                self._framebuffer.window(strip, offset, self._width),
+                r * self._fontsize + self._y_offset)
+        self._scroll_at = self._clock() + 1/self._scroll_rate
+
+    def _marquee_strip(self, text):
+        """
+        Get rendered strip for a scrolling row and its period in pixels.
+        The text is drawn twice, so that a window of display width taken
+        at any offset within the period wraps around seamlessly.
+        """
+        key = (text, self._fontsize, self._width, 'marquee')
+        marquee = self._row_cache.get(key)
+        if marquee is None:
+            period = self._atlas.text_width(text + MARQUEE_GAP)
+            image = Image.new('1', (period + self._width, self._fontsize))
+            self._atlas.blit(image, text)
+            self._atlas.blit(image, text, (period, 0))
+            marquee = (self._framebuffer.strip(image), period)
+            self._row_cache.put(key, marquee)
+        return marquee
+
+    def _row_strip(self, text):
+        """ Get rendered strip for a row, only rasterize text not in cache. """
+        key = (text, self._fontsize, self._width)
+        strip = self._row_cache.get(key)
+        if strip is None:
+            image = Image.new('1', (self._width, self._fontsize))
+            self._atlas.blit(image, text)
+            strip = self._framebuffer.strip(image)
+            self._row_cache.put(key, strip)
+        return strip
+
+    def get_frame(self):
+        """
+        Last frame sent to the display as `(number, width, height, data)`,
+        data in SSD1306 page format. None before the first frame.
+        Safe to call from any thread, the frame is not changed afterwards.
+        """
+        return self._frame
+
+    def to_image(self):
+        """ Copy of what is drawn on the display, as a PIL image. """
+        return self._framebuffer.to_image()
+
+    def get_stats(self):
+        """ Frame counters, bytes sent, errors and per stage timing histograms. """
+        return dict(
+            generation=self._generation,
+            sent_generation=self._sent_generation,
+            frames_rendered=self._frames_rendered,
+            frames_skipped=self._frames_skipped,
+            bytes_sent=self._backend.bytes_sent,
+            bus_errors=self._bus_errors,
+            backend=self._backend.get_stats(),
+            state=self._state,
+            power=self._power,
+            frames_scrolled=self._frames_scrolled,
+            reconnects=self._reconnects,
+            row_cache=self._row_cache.get_stats(),
+            timings={k: v.to_dict() for (k, v) in self._timings.items()},
+        )
 
     def stop(self):
         """ Shutdown. Stop thread and empty screen. """
-        self._stop = True
+        with self._lock:
+            self._stopping = True
+            self._lock.notify()
         self.clear_rows()
-        try:
-            self._display.fill(0)
-            self._display.show()
-        except:
-            self.log('Failed to clear display')
+        with self._render_lock:
+            try:
+                if self._state != STATE_UP:
+                    raise IOError('Display not initialized')
+                with self._transfer(urgent=True):
+                    self._write_window(0, self._pages - 1, 0, self._width - 1,
+                                       bytes(len(self._buffer)))
+            except:
+                self.log('Failed to clear display')
 
     def log(self, message, level=INFO):
         """ Log message. Can optionally set level."""
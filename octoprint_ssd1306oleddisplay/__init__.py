@@ -1,19 +1,23 @@
 # coding=utf-8
 from __future__ import absolute_import
 
-import textwrap
+import threading
 
+import flask
 import octoprint.plugin
 from octoprint.events import Events
 from octoprint.printer import PrinterCallback
+from octoprint.util import RepeatedTimer
 
-from octoprint_ssd1306oleddisplay.helpers import format_seconds, format_temp
+from octoprint_ssd1306oleddisplay.helpers import TemperatureFilter, format_seconds
+from octoprint_ssd1306oleddisplay.layout import DEFAULT_LAYOUT, SOURCES, Layout, Panel
+from octoprint_ssd1306oleddisplay.network import IPAddressProvider
+from octoprint_ssd1306oleddisplay.sparkline import Sparkline
 
-from .SSD1306 import SSD1306
-
-import socket
-hostname = socket.gethostname()
-IPAddr = socket.gethostbyname(hostname)
+# Sources whose changes are sent ahead of other transfers on a shared bus.
+URGENT_SOURCES = ('error', 'message')
+# Settings each panel may set, the others are shared by all panels.
+PANEL_SETTINGS = ('width', 'height', 'fontsize', 'refreshrate', 'layout', 'i2caddress')
 
 
 class Ssd1306_oled_displayPlugin(
@@ -23,87 +27,257 @@ class Ssd1306_oled_displayPlugin(
     octoprint.printer.PrinterCallback,
     octoprint.plugin.SettingsPlugin,
     octoprint.plugin.TemplatePlugin,
+    octoprint.plugin.SimpleApiPlugin,
+    octoprint.plugin.BlueprintPlugin,
+    octoprint.plugin.AssetPlugin,
 ):
 
     def __init__(self):
+        # Display of the first panel.
         self.display = None
+        # Backend settings the first display was created with.
+        self._backend_settings = None
+        # Displays with their layouts, the first one from the top level
+        # settings. Set on startup, the count is kept until restart.
+        self._panels = []
+        # Bus scheduler shared by the panels, None for a single panel.
+        self._bus = None
+        # Started from on_after_startup if the address should be shown.
+        self._ip_address = IPAddressProvider(self._on_ip_address)
+        self._temperatures = TemperatureFilter()
+        # Temperature graph and progress bar, None unless a layout shows them.
+        self._sparkline = None
+        self._progressbar = None
+        # Rotates the pages of the panels, and the values of the data
+        # sources they show.
+        self._page_timer = None
+        self._values = dict.fromkeys(SOURCES, '')
+        self._values['title'] = 'pCat'
+        self._values_lock = threading.Lock()
+        # PNG of the shown frame, created with the display.
+        self._preview = None
+        # Records printer callbacks if a file is set, see recording.Recorder.
+        self._recorder = None
 
     def on_after_startup(self, *args, **kwargs):
         self._logger.info('Initializing plugin')
-        self.display = SSD1306(
-            width=self._settings.get(['width']),
-            height=self._settings.get(['height']),
-            fontsize=self._settings.get(['fontsize']),
-            refresh_rate=self._settings.get(['refreshrate']),
-            logger=self._logger
-        )
-        self.display.start()
-        self._clear_display()
-        #self._write_line_to_display(0, IPAddr, commit=True)
-        self._write_line_to_display(0, 'pCat', commit=True)
+        self._apply_settings()
+        # Imported here, PIL and the display drivers are slow to import.
+        from .preview import FramePreview
+        self._preview = FramePreview()
+        if len(self._panels) > 1 and self._settings.get(['renderer']) != 'process':
+            from .bus import Bus
+            self._bus = Bus(max_utilization=self._get_bus_utilization())
+        for panel in self._panels:
+            panel.display = self._create_display(
+                width=panel.settings['width'],
+                height=panel.settings['height'],
+                fontsize=panel.settings['fontsize'],
+                refresh_rate=panel.settings['refreshrate'],
+                logger=self._logger,
+                backend=self._create_backend(panel.settings),
+                dim_after=self._settings.get_int(['dimafter']),
+                off_after=self._settings.get_int(['offafter']),
+                scroll_rate=self._settings.get_int(['scrollrate']),
+                bus=self._bus,
+            )
+            self._show_page(panel, 0)
+        self.display = self._panels[0].display
+        self._backend_settings = self._get_backend_settings(self._panels[0].settings)
+        self._start_page_timer()
+        if self._settings.get_boolean(['showip']):
+            self._ip_address.refresh()
+        if self._settings.get(['recordfile']):
+            from .recording import Recorder
+            self._recorder = Recorder(self._settings.get(['recordfile']))
+            self._logger.info('Recording printer callbacks to %s', self._recorder.path)
         self._printer.register_callback(self)
         self._logger.debug('Initialized')
 
     def on_shutdown(self):
         self._printer.unregister_callback(self)
-        self._clear_display(commit=True)
-        self.display.stop()
+        if self._page_timer is not None:
+            self._page_timer.cancel()
+        self._update_display({}, clear=True)
+        for panel in self._panels:
+            panel.display.stop()
+        if self._recorder is not None:
+            self._recorder.close()
 
     def on_event(self, event, payload, *args, **kwargs):
-        """ Display printer status events on the first line """
+        """ Display printer status events """
         self._logger.debug('on_event: %s, %s', event, payload)
+        if self._recorder is not None:
+            self._recorder.event(event, payload)
+        if event in (Events.ERROR, Events.PRINTER_STATE_CHANGED):
+            self._wake_display()
         if event == Events.ERROR:
-            self._write_line_to_display(
-                0, 'Error! {}'.format(payload['error']), commit=True)
+            error = payload['error']
+            self._set_values(error=error, title='Error! {}'.format(error))
         elif event == Events.PRINTER_STATE_CHANGED:
-            self._write_line_to_display(0, "Nečum!")
-            self._write_line_to_display(1, payload['state_string'])
-            #self._write_line_to_display(1, IPAddr)
+            state = payload['state_string']
+            self._set_values(state=state, status=state, title=self._title("Nečum!"))
             #if payload['state_id'] == 'OFFLINE':  # Clear printer/job messages if offline
             #    self._clear_display(start=1, commit=True)
         elif event == Events.SHUTDOWN:
-            self._clear_display(commit=True)
+            self._update_display({}, clear=True)
+        elif event == Events.CONNECTIVITY_CHANGED:
+            if self._settings.get_boolean(['showip']):
+                self._ip_address.refresh()
+
+    def _title(self, default):
+        """ Text for the first line, the IP address if enabled and known. """
+        if self._settings.get_boolean(['showip']) and self._ip_address.address:
+            return self._ip_address.address
+        return default
+
+    def _on_ip_address(self, address):
+        """ Called from the lookup thread when the IP address changed. """
+        self._logger.debug('IP address: %s', address)
+        if address and self._settings.get_boolean(['showip']):
+            self._set_values(ip=address, title=address)
+        else:
+            self._set_values(ip=address or '')
 
     def on_printer_add_temperature(self, data):
-        """ Display printer temperatures on the third line """
-        self._logger.debug('on_printer_add_temperature: %s', data)
-        msg = []
-        for k in ['bed', 'tool0', 'tool1', 'tool2']:
-            if k in data.keys():
-                msg.append(format_temp(k, data[k]))
-        self._write_line_to_display(2, ' '.join(msg), commit=True)
+        """ Display printer temperatures, and the graph if shown """
+        if self._recorder is not None:
+            self._recorder.temperature(data)
+        values = {}
+        text = self._temperatures.update(data)
+        if text is not None:
+            self._logger.debug('on_printer_add_temperature: %s', data)
+            values['temps'] = text
+        if self._sparkline is not None:
+            columns = self._sparkline.update(data)
+            if columns is not None:
+                values['sparkline'] = columns
+        if values:
+            self._set_values(**values)
 
     def on_printer_send_current_data(self, data, **kwargs):
-        """ Display print progress on fourth line """
+        """ Display print progress """
         self._logger.debug('on_printer_send_current_data: %s', data)
+        if self._recorder is not None:
+            self._recorder.current_data(data)
         completion = data['progress']['completion']
+        if data.get('state', {}).get('flags', {}).get('printing'):
+            # Keep the display on while printing.
+            self._wake_display()
 
         if completion is None:
             # Job complete or no job started.
-            self._write_line_to_display(3, '', commit=True)
+            values = dict(progress='', eta='', job='')
+            seconds_left = None
         else:
-            self._write_line_to_display(3, '{}% {}'.format(
-                int(completion),
-                # format_seconds(data['progress']['printTime']),
-                format_seconds(data['progress']['printTimeLeft']),
-            ), commit=True)
+            progress = '{}%'.format(int(completion))
+            # format_seconds(data['progress']['printTime']),
+            seconds_left = data['progress']['printTimeLeft']
+            eta = format_seconds(seconds_left)
+            values = dict(progress=progress, eta=eta,
+                          job='{} {}'.format(progress, eta))
+        if self._progressbar is not None:
+            # Only draws what changed, None if nothing did.
+            columns = self._progressbar.update(completion, seconds_left)
+            if columns is not None:
+                values['progressbar'] = columns
+        self._set_values(**values)
 
     def protocol_gcode_sent_hook(self, comm_instance, phase, cmd, cmd_type, gcode, *args, **kwargs):
-        """ Listen for gcode commands, specifically M117 (Set LCD message) on the second line """
-        if (gcode is not None) and (gcode == 'M117'):
-            self._logger.debug('Intercepted M117 gcode: {}'.format(cmd))
-            lines = textwrap.fill(
-                text=' '.join(cmd.split(' ')[1:]),
-                # Each char. is 8 px. wide
-                width=self._settings.get(
-                    ['width'])/self._settings.get(['fontsize']),
-                max_lines=1  # No. of available lines
-            ).split('\n')
-            self._logger.debug('Split message: "%s"', lines)
-            for i in range(0, len(lines)):
-                self._write_line_to_display(
-                    1+i, lines[i] if i < len(lines) else '')
-            self._commit_to_display()
+        """
+        Listen for gcode commands, specifically M117 (Set LCD message).
+        Called for every line sent to the printer, so only hand M117 over
+        to the display thread and do the formatting there.
+        """
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.gcode_sent(cmd, gcode)
+        if gcode != 'M117':
+            return
+        display = self.display
+        if display is not None:
+            display.call_soon(self._show_message, cmd)
+
+    def _show_message(self, cmd):
+        """ Show M117 message, runs on the display thread. """
+        self._logger.debug('Intercepted M117 gcode: {}'.format(cmd))
+        self._wake_display()
+        # Messages too long for the row scroll.
+        message = ' '.join(cmd.split(' ')[1:])
+        self._set_values(message=message, status=message)
+
+    def _panel_settings(self):
+        """
+        Settings of each panel, the first from the top level settings and
+        one more per entry of the `panels` setting, which override them.
+        """
+        first = {k: self._settings.get([k]) for k in PANEL_SETTINGS}
+        panels = [first]
+        for (i, panel) in enumerate(self._settings.get(['panels']) or []):
+            if self._settings.get(['backend']) == 'spi':
+                self._logger.warning('Only one SPI display is supported, ignoring panel %d', i + 2)
+                continue
+            settings = dict(first)
+            settings.update((k, v) for (k, v) in panel.items() if k in PANEL_SETTINGS)
+            panels.append(settings)
+        return panels
+
+    def _apply_settings(self):
+        """ Update values derived from settings. """
+        self._temperatures.hysteresis = self._settings.get(['temphysteresis'])
+        self._temperatures.min_interval = self._settings.get_float(
+            ['tempinterval'])
+        settings = self._panel_settings()
+        if not self._panels:
+            self._panels = [Panel(s) for s in settings]
+        for (panel, panel_settings) in zip(self._panels, settings):
+            panel.settings = panel_settings
+            try:
+                layout = Layout(panel_settings['layout'], panel.rows())
+            except ValueError as e:
+                self._logger.error('Invalid layout, using the default one: %s', e)
+                layout = Layout(DEFAULT_LAYOUT, panel.rows())
+            with self._values_lock:
+                panel.layout = layout
+                panel.page = min(panel.page, len(layout.pages) - 1)
+        # Graphs are sized for the first panel.
+        width = int(settings[0]['width'])
+        height = int(settings[0]['fontsize'])
+        self._apply_progressbar(width, height)
+        if not any(panel.layout.uses('sparkline') for panel in self._panels):
+            self._sparkline = None
+            return
+        # One column per sample, the graph spans `sparklineminutes`.
+        interval = self._settings.get_float(['sparklineminutes']) * 60 / width
+        if self._sparkline is None:
+            self._sparkline = Sparkline(width, height, interval)
+        else:
+            self._sparkline.interval = interval
+            if (width, height) != (self._sparkline.width, self._sparkline.height):
+                self._sparkline.resize(width, height)
+
+    def _apply_progressbar(self, width, height):
+        """ Create the progress bar if a layout shows it, keeping its progress. """
+        if not any(panel.layout.uses('progressbar') for panel in self._panels):
+            self._progressbar = None
+            return
+        if self._progressbar is not None and (width, height) == (
+                self._progressbar.width, self._progressbar.height):
+            return
+        # Imported here, PIL is slow to import.
+        from PIL import ImageFont
+
+        from .glyphs import GlyphAtlas
+        from .helpers import find_resource
+        from .progress import ProgressBar
+        font = ImageFont.truetype(find_resource('font/PressStart2P.ttf'), height)
+        progressbar = ProgressBar(width, height, GlyphAtlas(font, height))
+        if self._progressbar is not None:
+            progressbar.update(self._progressbar.completion, self._progressbar.seconds_left)
+        self._progressbar = progressbar
+        with self._values_lock:
+            # Shown with the next page drawn.
+            self._values['progressbar'] = progressbar.columns()
 
     def get_settings_defaults(self):
         return dict(
@@ -111,57 +285,267 @@ class Ssd1306_oled_displayPlugin(
             height=32,
             fontsize=8,
             refreshrate=1,
+            # More displays on the same I2C bus, each a dict overriding
+            # width, height, fontsize, refreshrate, layout or i2caddress.
+            # Applied on restart.
+            panels=[],
+            # Largest share of time the displays may keep a shared bus busy,
+            # above 0 and up to 1, None for no limit. Urgent updates (errors,
+            # M117 messages) are not held back.
+            busutilization=0.5,
+            # Steps per second for rows too long for the display.
+            scrollrate=8,
+            showip=False,
+            # Ignore temperature changes smaller than this, per heater.
+            temphysteresis=dict(bed=1.0, tool0=1.0, tool1=1.0, tool2=1.0),
+            # Minimum seconds between temperature updates.
+            tempinterval=2.0,
+            # Rows shown on the display, format strings using the sources
+            # in layout.SOURCES. Pages are separated by `---` lines.
+            layout=DEFAULT_LAYOUT,
+            # Seconds each page is shown if there are several.
+            pageinterval=10,
+            # Minutes shown by the {sparkline} temperature graph.
+            sparklineminutes=10,
+            # Render in a 'thread' of OctoPrint, or in a worker 'process' so
+            # that drawing and bus transfers do not compete for the GIL
+            # with the serial connection. Applied on restart.
+            renderer='thread',
+            # Display connection: 'i2c', 'spi' or 'fake' (in memory, no hardware).
+            backend='i2c',
+            i2caddress=0x3C,
+            # I2C clock in kHz (100, 400 or 1000), 0 to use the fastest one
+            # that works without errors, tried when the display starts.
+            # Slower clocks are used after repeated errors.
+            i2cfrequency=100,
+            # Largest I2C transfer in bytes, 0 for no limit.
+            i2cchunksize=0,
+            spidc='D24',
+            spireset='D25',
+            spics='CE0',
+            # Simulated bus speed of the fake backend.
+            fakekhz=400,
+            # Seconds without printer activity before the display is dimmed
+            # and turned off, 0 to disable.
+            dimafter=300,
+            offafter=1800,
+            # Record printer callbacks to this gzipped file, for replaying
+            # them with benchmarks/bench_replay.py. Applied on restart.
+            recordfile='',
         )
 
     def on_settings_save(self, data):
         # Cast values to integer before save.
-        for k in ('width', 'height', 'fontsize', 'refreshrate'):
+        for k in ('width', 'height', 'fontsize', 'refreshrate', 'scrollrate', 'dimafter', 'offafter',
+                  'pageinterval', 'sparklineminutes', 'i2cfrequency', 'i2cchunksize'):
             if data.get(k):
                 data[k] = max(0, int(data[k]))
+        if data.get('tempinterval') is not None:
+            data['tempinterval'] = max(0.0, float(data['tempinterval']))
+        if data.get('busutilization') is not None:
+            utilization = float(data['busutilization'])
+            if utilization <= 0:
+                # The bus would never be free, no limit is set with None.
+                self._logger.warning('Bus utilization must be above 0, not saved')
+                del data['busutilization']
+            else:
+                data['busutilization'] = min(1.0, utilization)
 
         octoprint.plugin.SettingsPlugin.on_settings_save(self, data)
-
-        # Re-initialize display with new parameters.
-        self.display = SSD1306(
-            width=self._settings.get(['width']),
-            height=self._settings.get(['height']),
-            fontsize=self._settings.get(['fontsize']),
-            refresh_rate=self._settings.get(['refreshrate']),
-            logger=self._logger
+        self._apply_settings()
+        if self._settings.get_boolean(['showip']):
+            self._ip_address.refresh()
+            if self._ip_address.address:
+                self._set_values(title=self._ip_address.address)
+
+        # Apply new parameters to the running displays.
+        if self.display is None:
+            return
+        if self._bus is not None:
+            self._bus.max_utilization = self._get_bus_utilization()
+        for (i, panel) in enumerate(self._panels):
+            backend = None
+            # Backends of the other panels are replaced on restart.
+            backend_settings = self._get_backend_settings(panel.settings)
+            if i == 0 and backend_settings != self._backend_settings:
+                backend = self._create_backend(panel.settings)
+                self._backend_settings = backend_settings
+            panel.display.reconfigure(
+                width=int(panel.settings['width']),
+                height=int(panel.settings['height']),
+                fontsize=int(panel.settings['fontsize']),
+                refresh_rate=int(panel.settings['refreshrate']),
+                backend=backend,
+                dim_after=self._settings.get_int(['dimafter']),
+                off_after=self._settings.get_int(['offafter']),
+                scroll_rate=self._settings.get_int(['scrollrate']),
+            )
+            # The layout may have changed.
+            self._show_page(panel, panel.page)
+        self._start_page_timer()
+
+    def _create_display(self, **options):
+        """
+        Start the display renderer, in a worker process if set and
+        possible, in a thread otherwise.
+        """
+        if self._settings.get(['renderer']) == 'process':
+            # Worker processes open their own bus handles.
+            options.pop('bus', None)
+            try:
+                from .process import ProcessDisplay
+                display = ProcessDisplay(**options)
+                display.start()
+                return display
+            except Exception as e:
+                self._logger.warning(
+                    'Display worker process unavailable, rendering in a thread: %s', e)
+        from .SSD1306 import SSD1306
+        display = SSD1306(**options)
+        display.start()
+        return display
+
+    def _get_backend_settings(self, panel_settings):
+        """ Backend name and options from settings, the address from `panel_settings`. """
+        name = self._settings.get(['backend'])
+        options = dict(
+            i2c=lambda: dict(
+                address=int(panel_settings['i2caddress']),
+                frequency=self._settings.get_int(['i2cfrequency']) * 1000 or None,
+                chunk_size=self._settings.get_int(['i2cchunksize']),
+            ),
+            spi=lambda: dict(
+                dc=self._settings.get(['spidc']),
+                reset=self._settings.get(['spireset']),
+                cs=self._settings.get(['spics']),
+            ),
+            fake=lambda: dict(khz=self._settings.get_float(['fakekhz'])),
+        )
+        if name not in options:
+            self._logger.warning('Unknown display backend %s, using i2c', name)
+            name = 'i2c'
+        return (name, options[name]())
+
+    def _get_bus_utilization(self):
+        """ Limit of the shared bus utilization, None for no limit. """
+        utilization = self._settings.get_float(['busutilization'])
+        if utilization is not None and utilization <= 0:
+            # Only set by editing config.yaml, on_settings_save rejects it.
+            utilization = self.get_settings_defaults()['busutilization']
+        return utilization
+
+    def _create_backend(self, panel_settings):
+        """ Create display backend selected in settings, for a panel. """
+        from .backends import create_backend
+        (name, options) = self._get_backend_settings(panel_settings)
+        if name == 'i2c' and self._bus is not None:
+            options = dict(options, bus=self._bus)
+        return create_backend(
+            name,
+            int(panel_settings['width']),
+            int(panel_settings['height']),
+            **options
         )
 
     def get_template_configs(self):
         return [
-            dict(type="navbar", custom_bindings=False),
+            dict(type="navbar", custom_bindings=True),
             dict(type="settings", custom_bindings=False)
         ]
 
+    def get_assets(self):
+        return dict(js=['js/ssd1306_oled_display.js'])
+
+    # ~~ BlueprintPlugin
+
+    @octoprint.plugin.BlueprintPlugin.route('/preview.png', methods=['GET'])
+    def get_preview(self):
+        """
+        What the display shows, as PNG. Encoded once per frame, clients
+        polling it get 304 Not Modified until the frame changes.
+        """
+        frame = self.display.get_frame() if self.display is not None else None
+        if frame is None:
+            flask.abort(404)
+        (etag, png) = self._preview.get(frame)
+        response = flask.Response(png, mimetype='image/png')
+        response.set_etag(etag)
+        # Revalidate on every request.
+        response.cache_control.no_cache = True
+        return response.make_conditional(flask.request)
+
+    # ~~ SimpleApiPlugin
+
+    def on_api_get(self, request):
+        """ Render pipeline statistics, as JSON. """
+        return flask.jsonify(self.get_stats())
+
+    def get_stats(self):
+        """ Statistics of the first display, the other panels and the shared bus. """
+        return dict(
+            display=self.display.get_stats() if self.display is not None else None,
+            panels=[panel.display.get_stats() for panel in self._panels[1:]
+                    if panel.display is not None],
+            bus=self._bus.get_stats() if self._bus is not None else None,
+            temperatures=self._temperatures.get_stats(),
+            preview=self._preview.get_stats() if self._preview is not None else None,
+        )
+
     # Simplify calls related to display.
 
-    def _write_line_to_display(self, line, text, commit=False):
-        """ Write line to display. """
-        try:
-            self.display.write_row(line, text)
-            if (commit):
-                self.display.commit()
-        except:
-            self._logger.debug('Display currently unavailable.')
-
-    def _clear_display(self, start=0, end=None, commit=False):
-        """ Clear row(s). """
-        try:
-            self.display.clear_rows(start, end)
-            if (commit):
-                self.display.commit()
-        except:
-            self._logger.debug('Display currently unavailable.')
-
-    def _commit_to_display(self):
-        """ Commit data to be written on screen. """
-        try:
-            self.display.commit()
-        except:
-            self._logger.debug('Display currently unavailable.')
+    def _wake_display(self):
+        """ Turn the displays back on and restart the idle timeout. """
+        for panel in self._panels:
+            if panel.display is not None:
+                panel.display.wake()
+
+    def _set_values(self, **values):
+        """ Set data sources, the rows of the shown pages using them are updated. """
+        with self._values_lock:
+            changed = [k for (k, v) in values.items() if self._values[k] != v]
+            if not changed:
+                return
+            self._values.update(values)
+            urgent = any(source in changed for source in URGENT_SOURCES)
+            for panel in self._panels:
+                if panel.display is None:
+                    continue
+                rows = panel.layout.render(panel.page, self._values, changed)
+                if rows:
+                    self._update_display(rows, urgent=urgent, panels=[panel])
+
+    def _show_page(self, panel, page):
+        """ Show all rows of a page of `panel`. """
+        with self._values_lock:
+            panel.page = page % len(panel.layout.pages)
+            self._update_display(
+                panel.layout.render(panel.page, self._values), clear=True, panels=[panel])
+
+    def _next_page(self):
+        """ Called by the page timer. """
+        for panel in self._panels:
+            if len(panel.layout.pages) > 1:
+                self._show_page(panel, panel.page + 1)
+
+    def _start_page_timer(self):
+        """ Rotate pages if a layout has several, runs until shutdown. """
+        if self._page_timer is None and any(
+                len(panel.layout.pages) > 1 for panel in self._panels):
+            self._page_timer = RepeatedTimer(
+                lambda: max(1, self._settings.get_float(['pageinterval'])),
+                self._next_page)
+            self._page_timer.start()
+
+    def _update_display(self, rows, clear=False, urgent=False, panels=None):
+        """
+        Write rows, a dict of row index to text, and show them together on
+        `panels`, all of them if None. Clear the other rows if `clear` is set.
+        """
+        for panel in self._panels if panels is None else panels:
+            try:
+                panel.display.update_rows(rows, clear=clear, urgent=urgent)
+            except:
+                self._logger.debug('Display currently unavailable.')
 
     # ~~ Softwareupdate hook
 
@@ -0,0 +1,350 @@
+from time import perf_counter, sleep
+
+# SSD1306 commands.
+SET_CONTRAST = 0x81
+SET_DISP = 0xAE
+SET_COL_ADDR = 0x21
+SET_PAGE_ADDR = 0x22
+# I2C control bytes, Co=0 and D/C# selects command or data stream.
+CONTROL_CMD = 0x00
+CONTROL_DATA = 0x40
+
+# I2C clock frequencies tried by I2CBackend, fastest first.
+FREQUENCIES = (1000000, 400000, 100000)
+# Frames sent at each frequency when probing.
+PROBE_FRAMES = 10
+# Failed writes in a row after which I2CBackend uses a slower frequency.
+FALLBACK_ERRORS = 3
+
+# Number of argument bytes following each command, used by FakeBackend.
+COMMAND_ARGS = {
+    SET_CONTRAST: 1,
+    SET_COL_ADDR: 2,
+    SET_PAGE_ADDR: 2,
+}
+
+
+def create_backend(name, width, height, **options):
+    """ Create backend by settings name: 'i2c', 'spi' or 'fake'. """
+    backends = dict(i2c=I2CBackend, spi=SPIBackend, fake=FakeBackend)
+    if name not in backends:
+        raise ValueError('Unknown display backend {}'.format(name))
+    return backends[name](width, height, **options)
+
+
+class Backend:
+    """
+    Transport to an SSD1306 controller.
+    `open` initializes the controller, after that commands and data are
+    sent with `command` and `data`. Counts the bytes sent.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.bytes_sent = 0
+
+    def open(self):
+        """ Initialize the controller, raise if it is not available. """
+        raise NotImplementedError
+
+    def command(self, *commands):
+        """ Send command bytes. """
+        raise NotImplementedError
+
+    def data(self, data):
+        """ Send data to display RAM at the current address. """
+        raise NotImplementedError
+
+    def close(self):
+        """ Release what `open` acquired, `open` may be called again later. """
+        pass
+
+    def take_over(self, old):
+        """ Replace backend `old`, which is released or handed over. """
+        old.close()
+
+    def get_stats(self):
+        """ Transport specific statistics. """
+        return {}
+
+
+class I2CBackend(Backend):
+    """
+    Display connected through I2C. The bus handle is kept by `open`, or
+    taken from `bus` if the bus is shared with other displays.
+    The bus runs at `frequency` Hz. If None, `open` first probes the
+    clock frequencies in FREQUENCIES, fastest first, by sending frames,
+    and keeps the fastest one without errors. After FALLBACK_ERRORS
+    failed writes in a row the next `open` uses a slower frequency.
+    Data is written in transfers of at most `chunk_size` bytes including
+    the control byte, 0 for no limit. A bus handle opened here is
+    released by `close`, or kept by the backend that takes over, see
+    `take_over`.
+    """
+
+    def __init__(self, width, height, address=0x3C, i2c=None, bus=None, frequency=100000,
+                 chunk_size=0):
+        super(I2CBackend, self).__init__(width, height)
+        self.address = address
+        self.i2c = i2c
+        self.bus = bus
+        self.frequency = frequency
+        self.chunk_size = chunk_size
+        self._device = None
+        # Frequency of the handle opened here, None if it was passed in.
+        self._opened_frequency = None
+        # Failed writes in a row, see open.
+        self._failures = 0
+        self.write_errors = 0
+        self.fallbacks = 0
+        # Results of the clock probe, fastest first.
+        self.probe = []
+
+    def open(self):
+        if self._failures >= FALLBACK_ERRORS and self.frequency is not None:
+            slower = [f for f in FREQUENCIES if f < self.frequency]
+            if slower:
+                self.frequency = slower[0]
+                self.fallbacks += 1
+            self._failures = 0
+        if self.frequency is None:
+            self._probe()
+        else:
+            self._connect(self.frequency)
+
+    def _connect(self, frequency):
+        """ Open the bus at `frequency` if needed and initialize the display. """
+        # Imported here to keep importing the plugin fast.
+        import adafruit_ssd1306
+        if self.bus is not None:
+            # Shared buses run at the lowest frequency asked for.
+            self.i2c = self.bus.open(frequency)
+            frequency = self.bus.frequency
+        elif self.i2c is None or self._opened_frequency not in (None, frequency):
+            import busio
+            from board import SCL, SDA
+            if self.i2c is not None and hasattr(self.i2c, 'deinit'):
+                self.i2c.deinit()
+            self.i2c = busio.I2C(SCL, SDA, frequency=frequency)
+            self._opened_frequency = frequency
+        try:
+            # The driver sends the initialization sequence.
+            display = adafruit_ssd1306.SSD1306_I2C(
+                self.width, self.height, self.i2c, addr=self.address)
+        except:
+            self._failures += 1
+            self.write_errors += 1
+            raise
+        self._device = display.i2c_device
+        self.frequency = frequency
+
+    def close(self):
+        if self._opened_frequency is not None and hasattr(self.i2c, 'deinit'):
+            self.i2c.deinit()
+        if self._opened_frequency is not None or self.bus is not None:
+            self.i2c = None
+        self._opened_frequency = None
+        self._device = None
+
+    def take_over(self, old):
+        """
+        Keep the bus handle of `old` if it was opened there, e.g. when
+        only the address or chunk size changed.
+        """
+        if (isinstance(old, I2CBackend) and old._opened_frequency is not None
+                and self.bus is None and self.i2c is None):
+            (self.i2c, self._opened_frequency) = (old.i2c, old._opened_frequency)
+            (old.i2c, old._opened_frequency) = (None, None)
+        old.close()
+
+    def _probe(self):
+        """ Send PROBE_FRAMES blank frames at each frequency, keep the fastest without errors. """
+        pages = self.height // 8
+        frame = bytes(128 * pages)
+        self.probe = []
+        for frequency in FREQUENCIES:
+            errors = 0
+            try:
+                self._connect(frequency)
+            except Exception:
+                errors = PROBE_FRAMES
+            start = perf_counter()
+            for i in range(PROBE_FRAMES - errors):
+                try:
+                    self.command(SET_COL_ADDR, 0, 127, SET_PAGE_ADDR, 0, pages - 1)
+                    self.data(frame)
+                except Exception:
+                    errors += 1
+            elapsed = perf_counter() - start
+            self.probe.append(dict(
+                frequency=frequency,
+                frames_per_second=(PROBE_FRAMES - errors) / elapsed if elapsed else 0,
+                errors=errors,
+            ))
+            if not errors:
+                self._failures = 0
+                return
+        self.frequency = None
+        raise IOError('No I2C clock frequency without errors')
+
+    def _attach(self):
+        """
+        Use the handle of the shared bus, opened again by another display
+        at a slower frequency. The display keeps its state, only the
+        device is created again.
+        """
+        from adafruit_bus_device.i2c_device import I2CDevice
+        self.i2c = self.bus.i2c
+        self.frequency = self.bus.frequency
+        self._device = I2CDevice(self.i2c, self.address, probe=False)
+
+    def _write(self, data):
+        if self.bus is not None and self.bus.i2c is not self.i2c:
+            self._attach()
+        try:
+            with self._device as device:
+                device.write(data)
+        except:
+            self._failures += 1
+            self.write_errors += 1
+            raise
+        self._failures = 0
+        self.bytes_sent += len(data)
+
+    def command(self, *commands):
+        self._write(bytes((CONTROL_CMD,) + commands))
+
+    def data(self, data):
+        data = bytes(data)
+        # Display RAM addresses advance from one transfer to the next. The
+        # control byte counts towards the chunk size.
+        step = max(1, self.chunk_size - 1) if self.chunk_size else max(1, len(data))
+        for start in range(0, len(data), step):
+            self._write(bytes([CONTROL_DATA]) + data[start:start + step])
+
+    def get_stats(self):
+        return dict(
+            frequency=self.frequency,
+            chunk_size=self.chunk_size,
+            write_errors=self.write_errors,
+            fallbacks=self.fallbacks,
+            probe=self.probe,
+        )
+
+
+class SPIBackend(Backend):
+    """ Display connected through SPI, pins are names of `board` attributes. """
+
+    def __init__(self, width, height, dc='D24', reset='D25', cs='CE0', baudrate=8000000):
+        super(SPIBackend, self).__init__(width, height)
+        self.pins = dict(dc=dc, reset=reset, cs=cs)
+        self.baudrate = baudrate
+        self._device = None
+        self._dc = None
+        # Pins and bus, kept from one `open` to the next until `close`.
+        self._io = None
+        self._spi = None
+
+    def open(self):
+        import adafruit_ssd1306
+        import board
+        import busio
+        import digitalio
+        if self._io is None:
+            self._io = {k: digitalio.DigitalInOut(getattr(board, v))
+                        for (k, v) in self.pins.items()}
+        if self._spi is None:
+            self._spi = busio.SPI(board.SCK, MOSI=board.MOSI)
+        display = adafruit_ssd1306.SSD1306_SPI(
+            self.width, self.height, self._spi, self._io['dc'], self._io['reset'],
+            self._io['cs'], baudrate=self.baudrate)
+        self._device = display.spi_device
+        self._dc = self._io['dc']
+
+    def close(self):
+        for pin in (self._io or {}).values():
+            pin.deinit()
+        if self._spi is not None:
+            self._spi.deinit()
+        self._io = None
+        self._spi = None
+        self._device = None
+        self._dc = None
+
+    def _write(self, dc, data):
+        self._dc.value = dc
+        with self._device as spi:
+            spi.write(data)
+        self.bytes_sent += len(data)
+
+    def command(self, *commands):
+        self._write(0, bytes(commands))
+
+    def data(self, data):
+        self._write(1, bytes(data))
+
+
+class FakeBackend(Backend):
+    """
+    In-memory display for tests and benchmarks.
+    Records every transfer as it would be sent over I2C, keeps a copy of
+    display RAM, and simulates the time transfers take at `khz` (no delay
+    if 0). Each byte takes 9 clock cycles including the acknowledge bit.
+    """
+
+    def __init__(self, width, height, khz=0, sleep=sleep):
+        super(FakeBackend, self).__init__(width, height)
+        self.khz = khz
+        self._sleep = sleep
+        self.writes = []
+        self.opened = 0
+        self.on = False
+        self.contrast = 0xFF
+        self.ram = bytearray((height // 8) * width)
+        self._offset = (128 - width) // 2 if width != 128 else 0
+        self._columns = (0, width - 1)
+        self._pages = (0, height // 8 - 1)
+        self._address = (0, 0)
+
+    def open(self):
+        self.opened += 1
+        self.on = True
+        self.ram = bytearray((self.height // 8) * self.width)
+
+    def _write(self, data):
+        self.writes.append(bytes(data))
+        self.bytes_sent += len(data)
+        if self.khz:
+            # Address byte and data, 9 clock cycles per byte.
+            self._sleep((len(data) + 1) * 9 / (self.khz * 1000))
+
+    def command(self, *commands):
+        self._write(bytes((CONTROL_CMD,) + commands))
+        i = 0
+        while i < len(commands):
+            command = commands[i]
+            args = commands[i + 1:i + 1 + COMMAND_ARGS.get(command, 0)]
+            i += 1 + len(args)
+            if command == SET_COL_ADDR:
+                self._columns = (args[0] - self._offset, args[1] - self._offset)
+                self._address = (self._columns[0], self._pages[0])
+            elif command == SET_PAGE_ADDR:
+                self._pages = tuple(args)
+                self._address = (self._columns[0], self._pages[0])
+            elif command == SET_CONTRAST:
+                self.contrast = args[0]
+            elif command in (SET_DISP, SET_DISP | 1):
+                self.on = bool(command & 1)
+
+    def data(self, data):
+        self._write(bytes([CONTROL_DATA]) + bytes(data))
+        # Horizontal addressing, wraps within the column and page window.
+        (column, page) = self._address
+        for byte in data:
+            self.ram[page * self.width + column] = byte
+            column += 1
+            if column > self._columns[1]:
+                column = self._columns[0]
+                page = page + 1 if page < self._pages[1] else self._pages[0]
+        self._address = (column, page)
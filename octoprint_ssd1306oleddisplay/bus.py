@@ -0,0 +1,121 @@
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+from time import monotonic
+
+from octoprint_ssd1306oleddisplay.stats import Histogram
+
+# Transfer priorities, lower first.
+URGENT = 0
+NORMAL = 1
+
+
+class Bus:
+    """
+    I2C bus shared by several displays.
+    The bus handle is opened once, by the first display that needs it.
+    Transfers of whole frames are serialized: urgent ones (errors, M117
+    messages) go first, and the others are delayed to keep the bus busy
+    at most `max_utilization` of the time, averaged over `burst` seconds,
+    None for no limit.
+    """
+
+    def __init__(self, max_utilization=0.5, burst=0.1, clock=monotonic):
+        self.max_utilization = max_utilization
+        self._burst = burst
+        self._clock = clock
+        self._lock = threading.Condition()
+        self._i2c = None
+        # Clock frequency of the bus handle, in Hz.
+        self.frequency = None
+        self._waiting = []
+        self._tickets = itertools.count()
+        self._busy = False
+        # Seconds of bus time that may be used now, see _throttle_delay.
+        self._credit = burst
+        self._refilled = clock()
+        self._created = clock()
+        self._busy_time = 0
+        self._transfers = dict(urgent=0, normal=0)
+        self._throttled = 0
+        self._wait = Histogram()
+
+    @property
+    def i2c(self):
+        """ Current bus handle, None before the first `open`. """
+        return self._i2c
+
+    def open(self, frequency=100000):
+        """
+        The bus handle, opened on first use. It is opened again if a slower
+        `frequency` is asked for, all displays use the slowest one. Displays
+        holding the old handle switch to the new one, see I2CBackend.
+        """
+        with self._lock:
+            if self._i2c is None or frequency < self.frequency:
+                # Imported here to keep importing the plugin fast.
+                import busio
+                from board import SCL, SDA
+                if self._i2c is not None and hasattr(self._i2c, 'deinit'):
+                    self._i2c.deinit()
+                self._i2c = busio.I2C(SCL, SDA, frequency=frequency)
+                self.frequency = frequency
+            return self._i2c
+
+    def _throttle_delay(self, now):
+        """ Seconds until a normal transfer is within the utilization bound. """
+        if self.max_utilization is None:
+            return 0
+        self._credit = min(self._burst, self._credit
+                           + (now - self._refilled) * self.max_utilization)
+        self._refilled = now
+        if self._credit >= 0:
+            return 0
+        return -self._credit / self.max_utilization
+
+    @contextmanager
+    def transfer(self, urgent=False):
+        """ Wait for the bus, the transfer is done in the `with` block. """
+        ticket = (URGENT if urgent else NORMAL, next(self._tickets))
+        requested = self._clock()
+        with self._lock:
+            heapq.heappush(self._waiting, ticket)
+            throttled = False
+            while True:
+                if not self._busy and self._waiting[0] == ticket:
+                    delay = 0 if urgent else self._throttle_delay(self._clock())
+                    if delay <= 0:
+                        break
+                    throttled = True
+                    # Woken early if a more urgent transfer arrives.
+                    self._lock.wait(delay)
+                else:
+                    self._lock.wait()
+            heapq.heappop(self._waiting)
+            self._busy = True
+            self._throttled += throttled
+        start = self._clock()
+        self._wait.record(start - requested)
+        try:
+            yield
+        finally:
+            elapsed = self._clock() - start
+            with self._lock:
+                self._busy = False
+                self._busy_time += elapsed
+                self._credit -= elapsed
+                self._transfers['urgent' if urgent else 'normal'] += 1
+                self._lock.notify_all()
+
+    def get_stats(self):
+        elapsed = self._clock() - self._created
+        return dict(
+            transfers=dict(self._transfers),
+            throttled=self._throttled,
+            busy_seconds=self._busy_time,
+            utilization=self._busy_time / elapsed if elapsed > 0 else 0,
+            max_utilization=self.max_utilization,
+            frequency=self.frequency,
+            wait=self._wait.to_dict(),
+        )
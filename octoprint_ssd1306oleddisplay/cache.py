@@ -0,0 +1,49 @@
+from collections import OrderedDict
+
+
+class LRUCache:
+    """ Bounded least recently used cache with hit/miss counters. """
+
+    def __init__(self, maxsize=32):
+        self._maxsize = maxsize
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        """ Get cached value and mark it as recently used. """
+        try:
+            value = self._items[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """ Add value, evict the least recently used one if full. """
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self._maxsize:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._items.clear()
+
+    def get_stats(self):
+        return dict(
+            size=len(self._items),
+            maxsize=self._maxsize,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+        )
@@ -0,0 +1,120 @@
+from PIL import Image
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Image.Transpose was added in Pillow 9.1.
+TRANSPOSE = getattr(Image, 'Transpose', Image).TRANSPOSE
+# Byte with reversed bit order, for each byte value.
+REVERSE_BITS = bytes(int('{:08b}'.format(i)[::-1], 2) for i in range(256))
+
+
+def create_framebuffer(width, height, use_numpy=None):
+    """ NumPy framebuffer if requested or, by default, if NumPy is installed. """
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    if use_numpy:
+        return NumpyFramebuffer(width, height)
+    return ImageFramebuffer(width, height)
+
+
+def unpack(data, width, height):
+    """ 1-bit PIL image from a frame in SSD1306 page format, see `pack`. """
+    image = Image.new('1', (width, height))
+    for page in range(height // 8):
+        columns = bytes(data[page * width:(page + 1) * width]).translate(REVERSE_BITS)
+        # Each column becomes an image row, top pixel first.
+        strip = Image.frombytes('1', (8, width), columns).transpose(TRANSPOSE)
+        image.paste(strip, (0, page * 8))
+    return image
+
+
+class ImageFramebuffer:
+    """
+    Framebuffer backed by a 1-bit PIL image.
+    Packed into the SSD1306 page format, where each byte holds 8 vertical
+    pixels with the top one in the least significant bit.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.pages = height // 8
+        self.image = Image.new('1', (width, height))
+
+    def strip(self, image):
+        """ Convert a rendered 1-bit image into what `blit` takes. """
+        return image
+
+    def window(self, strip, x, width):
+        """ Part of a strip from column `x`, `width` columns wide. """
+        return strip.crop((x, 0, x + width, strip.height))
+
+    def graphic(self, columns, height):
+        """
+        Convert graphic columns into what `blit` takes. Each column is
+        `(height + 7) // 8` bytes with the top pixel in the most
+        significant bit.
+        """
+        stride = (height + 7) // 8
+        image = Image.frombytes('1', (stride * 8, len(columns) // stride), columns)
+        # Image rows are columns.
+        image = image.transpose(TRANSPOSE)
+        return image.crop((0, 0, image.width, height))
+
+    def blit(self, strip, y, x=0):
+        self.image.paste(strip, (x, y))
+
+    def pack(self, buffer):
+        """ Write the framebuffer in page format to `buffer`. """
+        # Rows of the transposed image are columns, packed 8 pixels per
+        # byte with the top pixel in the most significant bit.
+        columns = self.image.transpose(TRANSPOSE).tobytes().translate(REVERSE_BITS)
+        stride = (self.height + 7) // 8
+        for page in range(self.pages):
+            buffer[page * self.width:(page + 1) * self.width] = \
+                columns[page::stride][:self.width]
+
+    def to_image(self):
+        return self.image.copy()
+
+
+class NumpyFramebuffer:
+    """ Framebuffer backed by a NumPy array, packed with vectorized bit operations. """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.pages = height // 8
+        self.pixels = numpy.zeros((height, width), dtype=numpy.bool_)
+
+    def strip(self, image):
+        """ Convert a rendered 1-bit image into what `blit` takes. """
+        return numpy.asarray(image, dtype=numpy.bool_)
+
+    def window(self, strip, x, width):
+        """ Part of a strip from column `x`, `width` columns wide. """
+        return strip[:, x:x + width]
+
+    def graphic(self, columns, height):
+        """ Convert graphic columns into what `blit` takes, see ImageFramebuffer. """
+        stride = (height + 7) // 8
+        bits = numpy.frombuffer(columns, dtype=numpy.uint8).reshape(-1, stride)
+        return numpy.unpackbits(bits, axis=1)[:, :height].T.astype(numpy.bool_)
+
+    def blit(self, strip, y, x=0):
+        h = min(strip.shape[0], self.height - y)
+        w = min(strip.shape[1], self.width - x)
+        if h > 0 and w > 0:
+            self.pixels[y:y + h, x:x + w] = strip[:h, :w]
+
+    def pack(self, buffer):
+        """ Write the framebuffer in page format to `buffer`. """
+        bands = self.pixels[:self.pages * 8].reshape(self.pages, 8, self.width)
+        packed = numpy.packbits(bands.transpose(0, 2, 1), axis=2, bitorder='little')
+        buffer[:self.pages * self.width] = packed.tobytes()
+
+    def to_image(self):
+        return Image.fromarray(self.pixels)
@@ -0,0 +1,49 @@
+from PIL import Image, ImageDraw
+
+# Characters rendered when the atlas is created, other characters are
+# rendered the first time they are used.
+PRELOAD = ''.join(chr(c) for c in range(32, 127))
+
+
+class GlyphAtlas:
+    """
+    Cache of pre-rendered 1-bit glyphs for a fixed-size font.
+    Rows are composed by pasting cached glyphs instead of rasterizing
+    the text through FreeType for every frame.
+    """
+
+    def __init__(self, font, height, preload=PRELOAD):
+        self._font = font
+        self._height = height
+        self._glyphs = {}
+        for char in preload:
+            self.glyph(char)
+
+    def __len__(self):
+        return len(self._glyphs)
+
+    def glyph(self, char):
+        """ Get glyph bitmap for a character, render it if not cached. """
+        glyph = self._glyphs.get(char)
+        if glyph is None:
+            advance = max(1, int(round(self._font.getlength(char))))
+            glyph = Image.new('1', (advance, self._height))
+            ImageDraw.Draw(glyph).text((0, 0), char, font=self._font, fill=255)
+            self._glyphs[char] = glyph
+        return glyph
+
+    def text_width(self, text):
+        """ Width of `text` in pixels. """
+        return sum(self.glyph(char).width for char in text)
+
+    def blit(self, image, text, xy=(0, 0), width=None):
+        """ Compose `text` into `image` at `xy`, clipped to `width` pixels. """
+        (x, y) = xy
+        end = x + (width if width is not None else image.width)
+        for char in text:
+            if x >= end:
+                break
+            glyph = self.glyph(char)
+            image.paste(glyph, (x, y))
+            x += glyph.width
+        return x
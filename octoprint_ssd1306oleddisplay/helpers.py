@@ -1,16 +1,56 @@
 import os
-import sys
+from functools import lru_cache
+from time import monotonic
 
+# Heaters shown on the display, in order.
+HEATERS = ['bed', 'tool0', 'tool1', 'tool2']
 
+
+@lru_cache(maxsize=None)
 def find_resource(file):
     # Find a resource in the same parent module as this module
-    guesses = []
-    for p in sys.path:
-        f = os.path.join(p, os.path.dirname(__file__), file)
-        guesses.append(f)
-        if os.path.isfile(f):
-            return f
-    raise ValueError('Cannot find resource {} at {}'.format(file, guesses))
+    f = os.path.join(os.path.dirname(os.path.abspath(__file__)), file)
+    if not os.path.isfile(f):
+        raise ValueError('Cannot find resource {} at {}'.format(file, f))
+    return f
+
+
+def changed_windows(old, new, width, pages):
+    """
+    Compare two framebuffers in SSD1306 page format (one byte per column,
+    `width` bytes per page) and return a list of `(page, first, last)` with
+    the inclusive column range that changed for each changed page.
+    """
+    windows = []
+    for page in range(pages):
+        start = page * width
+        end = start + width
+        if old[start:end] == new[start:end]:
+            continue
+        first = 0
+        while old[start + first] == new[start + first]:
+            first += 1
+        last = width - 1
+        while old[start + last] == new[start + last]:
+            last -= 1
+        windows.append((page, first, last))
+    return windows
+
+
+def changed_columns(old, new, stride):
+    """
+    Compare two graphics of the same size, columns of `stride` bytes, and
+    return the range `(first, end)` of columns that changed, None if none.
+    """
+    if old == new:
+        return None
+    first = 0
+    while old[first] == new[first]:
+        first += 1
+    last = len(new) - 1
+    while old[last] == new[last]:
+        last -= 1
+    return (first // stride, last // stride + 1)
 
 
 def format_seconds(seconds):
@@ -34,3 +74,50 @@ def format_temp(tool, temp):
         else:
             target_dir = '+' if temp['target'] > temp['actual'] else '-'
     return '{}:{}{}'.format(tool_txt, int(temp['actual']), target_dir)
+
+
+class TemperatureFilter:
+    """
+    Coalesce temperature updates, only returning text when it changed.
+    - Readings within `hysteresis[heater]` degrees of the shown reading,
+      with the same target, are ignored.
+    - Changes are returned at most once every `min_interval` seconds.
+    """
+
+    def __init__(self, hysteresis=None, min_interval=0, clock=monotonic):
+        self.hysteresis = hysteresis or {}
+        self.min_interval = min_interval
+        self._clock = clock
+        self._shown = {}
+        self._text = None
+        self._last = None
+        self.received = 0
+        self.committed = 0
+
+    def update(self, data):
+        """ Returns text to display, or None if the display should not change. """
+        self.received += 1
+        now = self._clock()
+        if self._last is not None and now - self._last < self.min_interval:
+            return None
+        temps = {}
+        for k in HEATERS:
+            if k not in data:
+                continue
+            temp = data[k]
+            shown = self._shown.get(k)
+            if (shown is not None and shown['target'] == temp['target']
+                    and abs(shown['actual'] - temp['actual']) < self.hysteresis.get(k, 0)):
+                temp = shown  # Keep showing previous reading.
+            temps[k] = temp
+        text = ' '.join(format_temp(k, temp) for (k, temp) in temps.items())
+        if text == self._text:
+            return None
+        self._shown = temps
+        self._text = text
+        self._last = now
+        self.committed += 1
+        return text
+
+    def get_stats(self):
+        return dict(received=self.received, committed=self.committed)
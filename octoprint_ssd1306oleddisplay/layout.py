@@ -0,0 +1,103 @@
+from operator import itemgetter
+from string import Formatter
+
+# Data sources that rows can show, see Layout.
+SOURCES = (
+    'title',        # IP address if shown, last error, or plugin name
+    'status',       # Last printer state or M117 message
+    'state',        # Printer state
+    'message',      # Last M117 message
+    'error',        # Last error
+    'ip',           # IP address
+    'temps',        # Temperatures
+    'progress',     # Print progress, e.g. '42%'
+    'eta',          # Print time left
+    'job',          # Progress and time left
+    'sparkline',    # Temperature graph, only on a row of its own
+    'progressbar',  # Progress bar and time left, only on a row of its own
+)
+# Sources drawn as graphics, see SSD1306.update_rows.
+GRAPHICS = ('sparkline', 'progressbar')
+# Rows of the default layout, like the plugin has always shown them.
+DEFAULT_LAYOUT = '{title}\n{status}\n{temps}\n{job}'
+# Line separating pages in a layout.
+PAGE_SEPARATOR = '---'
+
+
+class Layout:
+    """
+    Pages of display rows, each row a format string using data sources,
+    e.g. `{state} {progress}`. Pages in `text` are separated by `---`
+    lines, rows after the display's `rows` are ignored.
+    Rows are compiled once, and only rows using changed sources are
+    formatted again.
+    """
+
+    def __init__(self, text, rows):
+        self.pages = []
+        # Source to (page, row) using it.
+        self._uses = {source: set() for source in SOURCES}
+        page = []
+        for line in text.splitlines() + [PAGE_SEPARATOR]:
+            if line.strip() != PAGE_SEPARATOR:
+                page.append(line)
+                continue
+            self.pages.append([self._compile(len(self.pages), r, row)
+                               for (r, row) in enumerate(page[:rows])])
+            page = []
+
+    def _compile(self, page, row, text):
+        """ Formatter for one row, a function of the source values. """
+        fields = [(name, spec, conversion) for (_, name, spec, conversion)
+                  in Formatter().parse(text) if name is not None]
+        for (name, _, _) in fields:
+            if name not in SOURCES:
+                raise ValueError('Unknown layout source {{{}}} in row {} of page {}'.format(
+                    name, row, page + 1))
+            self._uses[name].add((page, row))
+        if not fields:
+            text = text.replace('{{', '{').replace('}}', '}')
+            return lambda values: text
+        if len(fields) == 1 and text == '{' + fields[0][0] + '}':
+            # Shown as is, also graphics.
+            return itemgetter(fields[0][0])
+        for (name, _, _) in fields:
+            if name in GRAPHICS:
+                raise ValueError('{{{}}} must be on a row of its own, row {} of page {}'.format(
+                    name, row, page + 1))
+        return text.format_map
+
+    def uses(self, source):
+        """ True if any row shows `source`. """
+        return bool(self._uses[source])
+
+    def render(self, page, values, changed=None):
+        """
+        Rows of `page` as a dict of row index to text. Only rows using
+        sources in `changed` are included, all rows if it is None.
+        """
+        rows = self.pages[page]
+        if changed is None:
+            indexes = range(len(rows))
+        else:
+            indexes = {r for source in changed
+                       for (p, r) in self._uses[source] if p == page}
+        return {r: rows[r](values) for r in indexes}
+
+
+class Panel:
+    """
+    One display of the printer and what it shows: its `settings` (width,
+    height, fontsize, refreshrate, layout, i2caddress), compiled `layout`
+    and shown `page`.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.display = None
+        self.layout = None
+        self.page = 0
+
+    def rows(self):
+        """ Number of text rows on the display. """
+        return max(1, round(int(self.settings['height']) / int(self.settings['fontsize'])))
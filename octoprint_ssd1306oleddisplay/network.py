@@ -0,0 +1,57 @@
+import socket
+import threading
+
+
+def local_ip_address():
+    """
+    Address of the interface used for the default route. Reads the local
+    routing decision only, no DNS or other network requests are made.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # Connecting an UDP socket sends nothing, it only selects a route.
+        sock.connect(('10.254.254.254', 1))
+        return sock.getsockname()[0]
+    except OSError:
+        return None
+    finally:
+        sock.close()
+
+
+class IPAddressProvider:
+    """
+    Look up the local IP address on a background thread.
+    Nothing is done until `refresh` is called, `callback(address)` is
+    called from the background thread whenever the address changes.
+    """
+
+    def __init__(self, callback=None, lookup=local_ip_address):
+        self._callback = callback
+        self._lookup = lookup
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pending = False
+        self.address = None
+
+    def refresh(self):
+        """ Start a lookup, or queue one if a lookup is already running. """
+        with self._lock:
+            if self._thread is not None:
+                self._pending = True
+                return
+            self._thread = threading.Thread(
+                target=self._run, name='ssd1306-ip', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            address = self._lookup()
+            if address != self.address:
+                self.address = address
+                if self._callback is not None:
+                    self._callback(address)
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+                self._pending = False
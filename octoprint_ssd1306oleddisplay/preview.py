@@ -0,0 +1,38 @@
+import io
+import threading
+from time import time
+
+from octoprint_ssd1306oleddisplay.framebuffer import unpack
+
+
+class FramePreview:
+    """
+    PNG of the frame shown on the display, for the web interface.
+    Each frame is encoded once, by the first request that asks for it,
+    and identified by an ETag so that clients can revalidate cheaply.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Frame numbers start again when OctoPrint restarts.
+        self._epoch = '{:x}'.format(int(time()))
+        self._number = None
+        self._etag = None
+        self._png = None
+        self.encoded = 0
+
+    def get(self, frame):
+        """ ETag and PNG for a frame from SSD1306.get_frame. """
+        (number, width, height, data) = frame
+        with self._lock:
+            if number != self._number:
+                output = io.BytesIO()
+                unpack(data, width, height).save(output, 'PNG')
+                self._png = output.getvalue()
+                self._etag = '{}-{}'.format(self._epoch, number)
+                self._number = number
+                self.encoded += 1
+            return (self._etag, self._png)
+
+    def get_stats(self):
+        return dict(encoded=self.encoded)
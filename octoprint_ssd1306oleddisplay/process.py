@@ -0,0 +1,326 @@
+import logging
+import marshal
+import os
+import struct
+import threading
+from collections import deque
+from logging import DEBUG, INFO, WARN
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from queue import Empty
+from time import monotonic
+
+# Shared memory layout: committed rows (marshalled list of text or
+# graphic bytes), then the last frame sent by the worker.
+ROWS_HEADER = struct.Struct('<I')  # length
+ROWS_SIZE = 16384
+FRAME_HEADER = struct.Struct('<IHH')  # number, width, height
+FRAME_SIZE = 1024  # 128x64
+FRAME_OFFSET = ROWS_HEADER.size + ROWS_SIZE
+MEMORY_SIZE = FRAME_OFFSET + FRAME_HEADER.size + FRAME_SIZE
+
+# Seconds to wait for the shared memory lock, a killed worker may have
+# left it locked until it is replaced.
+LOCK_TIMEOUT = 0.5
+# Seconds to wait for statistics from the worker, see get_stats.
+STATS_TIMEOUT = 0.1
+
+# Commands sent to the worker.
+ROWS = 'rows'
+WAKE = 'wake'
+RECONFIGURE = 'reconfigure'
+STATS = 'stats'
+STOP = 'stop'
+
+
+def read_rows(memory):
+    (length,) = ROWS_HEADER.unpack_from(memory.buf)
+    return marshal.loads(bytes(memory.buf[ROWS_HEADER.size:ROWS_HEADER.size + length]))
+
+
+def write_rows(memory, rows):
+    data = marshal.dumps(rows)
+    if len(data) > ROWS_SIZE:
+        raise ValueError('Rows too large for shared memory, {} bytes'.format(len(data)))
+    memory.buf[ROWS_HEADER.size:ROWS_HEADER.size + len(data)] = data
+    ROWS_HEADER.pack_into(memory.buf, 0, len(data))
+
+
+def read_frame(memory):
+    (number, width, height) = FRAME_HEADER.unpack_from(memory.buf, FRAME_OFFSET)
+    if not number:
+        return None
+    start = FRAME_OFFSET + FRAME_HEADER.size
+    return (number, width, height, bytes(memory.buf[start:start + width * height // 8]))
+
+
+def write_frame(memory, width, height, data):
+    """ Store a frame, numbered after the last one, also of earlier workers. """
+    (number, _, _) = FRAME_HEADER.unpack_from(memory.buf, FRAME_OFFSET)
+    start = FRAME_OFFSET + FRAME_HEADER.size
+    memory.buf[start:start + len(data)] = data
+    FRAME_HEADER.pack_into(memory.buf, FRAME_OFFSET, number + 1, width, height)
+
+
+def run_worker(name, lock, commands, results, options):
+    """ Worker process, shows the rows from shared memory until stopped. """
+    # Imported here, only the worker needs PIL and the display drivers.
+    from octoprint_ssd1306oleddisplay.SSD1306 import SSD1306
+
+    class WorkerDisplay(SSD1306):
+        def _send_image(self, urgent=False):
+            super(WorkerDisplay, self)._send_image(urgent)
+            with lock:
+                write_frame(memory, self._width, self._height, self._sent_buffer)
+
+    logging.basicConfig(level=logging.WARNING)
+    parent = os.getppid()
+    memory = SharedMemory(name=name)
+    display = WorkerDisplay(
+        logger=logging.getLogger('octoprint.plugins.ssd1306_oled_display.worker'),
+        **options)
+    display.start()
+    while True:
+        try:
+            (command, args) = commands.get(timeout=1)
+        except Empty:
+            if os.getppid() != parent:
+                # OctoPrint is gone.
+                break
+            continue
+        if command == ROWS:
+            with lock:
+                rows = read_rows(memory)
+            try:
+                display.update_rows(dict(enumerate(rows)), clear=True, urgent=bool(args))
+            except IndexError:
+                # Row count changes with the reconfigure that follows.
+                pass
+        elif command == WAKE:
+            display.wake()
+        elif command == RECONFIGURE:
+            display.reconfigure(**args)
+        elif command == STATS:
+            results.put(display.get_stats())
+        elif command == STOP:
+            break
+    display.stop()
+    display.join(1)
+    memory.close()
+
+
+class ProcessDisplay:
+    """
+    Display rendered in a worker process, with the interface of SSD1306
+    that the plugin uses. Committed rows are written to shared memory and
+    the worker is signalled, drawing and bus transfers happen in the
+    worker, so they do not hold OctoPrint's GIL.
+    A supervisor thread runs calls queued with call_soon and restarts the
+    worker when it exits, with exponential backoff between `retry_min`
+    and `retry_max` seconds. Other `options` are passed to SSD1306.
+    """
+
+    def __init__(self, width=128, height=32, fontsize=8, logger=None, retry_min=1, retry_max=300,
+                 check_interval=1, **options):
+        self._logger = logger
+        self._context = get_context('spawn')
+        self._options = dict(width=width, height=height, fontsize=fontsize, **options)
+        self._rows = [''] * round(height/fontsize)
+        self._memory = SharedMemory(create=True, size=MEMORY_SIZE)
+        write_rows(self._memory, self._rows)
+        # Guards self._rows and replacing the worker.
+        self._lock = threading.Condition()
+        self._calls = deque(maxlen=64)
+        self._stats_lock = threading.Lock()
+        # Last statistics received from the worker, and its results queue.
+        self._stats = dict(state='down')
+        self._stats_results = None
+        self._stopping = False
+        self._check_interval = check_interval
+        self._retry_min = retry_min
+        self._retry_max = retry_max
+        self._backoff = retry_min
+        self._retry_at = 0
+        self._started_at = 0
+        self._restarts = 0
+        self._worker = None
+        # Last frame read, returned while the memory is locked.
+        self._last_frame = None
+        self._thread = threading.Thread(target=self._supervise, daemon=True)
+
+    def log(self, message, level=INFO):
+        if self._logger is not None:
+            self._logger.log(level, message)
+
+    def _start_worker(self):
+        """
+        Start a worker with new queues and lock, a worker that was killed
+        may have left the old ones locked. Called with lock held.
+        """
+        # No worker uses the memory now, rows that could not be written
+        # meanwhile are written here.
+        write_rows(self._memory, self._rows)
+        self._shm_lock = self._context.Lock()
+        self._commands = self._context.Queue()
+        self._results = self._context.Queue()
+        self._worker = self._context.Process(
+            target=run_worker, daemon=True,
+            args=(self._memory.name, self._shm_lock, self._commands, self._results, self._options))
+        self._worker.start()
+        self._started_at = monotonic()
+        self._commands.put((ROWS, False))
+        self.log('Display worker started, pid {}'.format(self._worker.pid), level=DEBUG)
+
+    def start(self):
+        with self._lock:
+            self._start_worker()
+        self._thread.start()
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def _supervise(self):
+        """ Run queued calls, restart the worker if it exited. """
+        while True:
+            with self._lock:
+                self._lock.wait_for(lambda: self._stopping or self._calls,
+                                    timeout=self._check_interval)
+                if self._stopping:
+                    break
+            while self._calls:
+                (func, args) = self._calls.popleft()
+                try:
+                    func(*args)
+                except Exception as e:
+                    self.log('Queued call failed: {}'.format(e), level=WARN)
+            with self._lock:
+                if self._stopping or self._worker.is_alive():
+                    continue
+                now = monotonic()
+                if self._retry_at == 0:
+                    if now - self._started_at > self._retry_max:
+                        # Ran long enough, start over with short delays.
+                        self._backoff = self._retry_min
+                    self.log('Display worker exited with code {}'.format(
+                        self._worker.exitcode), level=WARN)
+                    self._retry_at = now + self._backoff
+                    self._backoff = min(self._backoff * 2, self._retry_max)
+                if now >= self._retry_at:
+                    self._retry_at = 0
+                    self._restarts += 1
+                    self._start_worker()
+
+    def call_soon(self, func, *args):
+        """ Run `func(*args)` on the supervisor thread. """
+        self._calls.append((func, args))
+        with self._lock:
+            self._lock.notify()
+
+    def update_rows(self, rows, clear=False, urgent=False):
+        """ Same as SSD1306.update_rows, the worker shows the rows. """
+        with self._lock:
+            for row in rows:
+                if not 0 <= row < len(self._rows):
+                    raise IndexError('Row index out of range, got {} but should be in range(0, {})'.format(
+                        row, len(self._rows)))
+            new = [''] * len(self._rows) if clear else list(self._rows)
+            for (r, text) in rows.items():
+                new[r] = text
+            if new == self._rows:
+                return
+            self._rows = new
+        self._send_rows(urgent)
+
+    def _send_rows(self, urgent=False):
+        """
+        Write the current rows to shared memory and signal the worker,
+        called without lock held. If the memory stays locked, the rows are
+        written when the worker is replaced.
+        """
+        with self._lock:
+            (lock, commands) = (self._shm_lock, self._commands)
+        if not lock.acquire(timeout=LOCK_TIMEOUT):
+            self.log('Display worker not responding, rows not sent', level=DEBUG)
+            return
+        try:
+            # Latest rows, also if another thread changed them meanwhile.
+            write_rows(self._memory, self._rows)
+        finally:
+            lock.release()
+        commands.put((ROWS, urgent))
+
+    def wake(self):
+        with self._lock:
+            commands = self._commands
+        commands.put((WAKE, None))
+
+    def reconfigure(self, **kwargs):
+        """ Same as SSD1306.reconfigure, also used for restarted workers. """
+        kwargs = {k: v for (k, v) in kwargs.items() if v is not None}
+        with self._lock:
+            self._options.update(kwargs)
+            self._commands.put((RECONFIGURE, kwargs))
+            count = round(self._options['height'] / self._options['fontsize'])
+            resized = count != len(self._rows)
+            if resized:
+                self._rows = (self._rows + [''] * count)[:count]
+        if resized:
+            self._send_rows()
+
+    def get_frame(self):
+        """ Last frame sent by the worker, see SSD1306.get_frame. """
+        with self._lock:
+            lock = self._shm_lock
+        if lock.acquire(timeout=LOCK_TIMEOUT):
+            try:
+                self._last_frame = read_frame(self._memory)
+            finally:
+                lock.release()
+        return self._last_frame
+
+    def get_stats(self, timeout=STATS_TIMEOUT):
+        """
+        Statistics of the worker's display, see SSD1306.get_stats, and of
+        the worker. If the worker does not answer within `timeout` seconds,
+        the last statistics received are returned.
+        """
+        with self._stats_lock:
+            with self._lock:
+                (worker, commands, results) = (self._worker, self._commands, self._results)
+            if results is not self._stats_results:
+                # Restarted, the statistics of the old worker are dropped.
+                self._stats = dict(state='down')
+                self._stats_results = results
+            # Late answers to earlier requests, the last one is the newest.
+            try:
+                while True:
+                    self._stats = results.get_nowait()
+            except Empty:
+                pass
+            commands.put((STATS, None))
+            try:
+                self._stats = results.get(timeout=timeout)
+            except Empty:
+                pass
+            stats = dict(self._stats)
+        if not worker.is_alive():
+            stats = dict(state='down')
+        stats['worker'] = dict(
+            pid=worker.pid,
+            alive=worker.is_alive(),
+            restarts=self._restarts,
+        )
+        return stats
+
+    def stop(self):
+        """ Stop the worker, which clears the display, and the supervisor. """
+        with self._lock:
+            self._stopping = True
+            self._lock.notify()
+        self._commands.put((STOP, None))
+        self._worker.join(5)
+        if self._worker.is_alive():
+            self._worker.terminate()
+        self._thread.join(1)
+        self._memory.close()
+        self._memory.unlink()
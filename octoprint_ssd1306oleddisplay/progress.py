@@ -0,0 +1,92 @@
+from PIL import Image
+
+from octoprint_ssd1306oleddisplay.framebuffer import TRANSPOSE
+from octoprint_ssd1306oleddisplay.helpers import format_seconds
+
+# Longest time left expected, room for it is kept right of the bar.
+ETA_TEMPLATE = '00h 00m'
+# Pixels between the bar and the time left.
+ETA_GAP = 2
+
+
+class ProgressBar:
+    """
+    Print progress as a bar followed by the time left, as graphic columns
+    for one display row, see SSD1306.update_rows.
+    Columns are kept between updates: progress only draws the columns
+    filled since the last update, and the time left is rasterized only
+    when its text changes, once a minute.
+    """
+
+    def __init__(self, width, height, atlas):
+        self.width = width
+        self.height = height
+        self.completion = None
+        self.seconds_left = None
+        self._atlas = atlas
+        self._stride = (height + 7) // 8
+        self._columns = bytearray(width * self._stride)
+        self._eta_x = width - min(width // 2, atlas.text_width(ETA_TEMPLATE))
+        # Columns between the left and right edge of the bar.
+        self._inside = max(0, self._eta_x - ETA_GAP - 2)
+        (top, bottom) = (1, max(1, height - 2))
+        self._full = self._column(range(top, bottom + 1))
+        self._empty = self._column((top, bottom))
+        self._set_column(0, self._full)
+        self._set_column(self._inside + 1, self._full)
+        for x in range(self._inside):
+            self._set_column(x + 1, self._empty)
+        self._filled = 0
+        self._eta = ''
+
+    def _column(self, ys):
+        """ Column with pixels `ys` set, top pixel in the most significant bit. """
+        column = bytearray(self._stride)
+        for y in ys:
+            column[y // 8] |= 0x80 >> (y % 8)
+        return bytes(column)
+
+    def _set_column(self, x, column):
+        self._columns[x * self._stride:(x + 1) * self._stride] = column
+
+    def update(self, completion, seconds_left):
+        """
+        Show `completion` percent and `seconds_left`, either may be None.
+        Returns the graph columns if they changed, None otherwise.
+        """
+        self.completion = completion
+        self.seconds_left = seconds_left
+        filled = 0
+        if completion is not None:
+            filled = int(self._inside * min(100, max(0, completion)) / 100)
+        eta = '' if seconds_left is None else format_seconds(seconds_left)
+        if filled == self._filled and eta == self._eta:
+            return None
+        # Only columns between the old and new end of the bar change.
+        if filled > self._filled:
+            for x in range(self._filled, filled):
+                self._set_column(x + 1, self._full)
+        else:
+            for x in range(filled, self._filled):
+                self._set_column(x + 1, self._empty)
+        self._filled = filled
+        if eta != self._eta:
+            self._draw_eta(eta)
+        return self.columns()
+
+    def _draw_eta(self, eta):
+        """ Rasterize the time left, right aligned. """
+        self._eta = eta
+        start = self._eta_x * self._stride
+        self._columns[start:] = bytes(len(self._columns) - start)
+        width = min(self._atlas.text_width(eta), self.width - self._eta_x)
+        if not width:
+            return
+        image = Image.new('1', (width, self.height))
+        self._atlas.blit(image, eta)
+        # Rows of the transposed image are columns.
+        self._columns[-width * self._stride:] = image.transpose(TRANSPOSE).tobytes()
+
+    def columns(self):
+        """ Graph columns from left to right, as bytes. """
+        return bytes(self._columns)
@@ -0,0 +1,92 @@
+import gzip
+import json
+import threading
+from time import monotonic
+
+from octoprint_ssd1306oleddisplay.helpers import HEATERS
+
+# Kinds of recorded callbacks.
+EVENT = 'e'
+TEMPERATURE = 't'
+CURRENT_DATA = 'd'
+GCODE_SENT = 'g'
+
+
+class Recorder:
+    """
+    Records the printer callbacks of the plugin to a gzipped file, one
+    JSON list per line: milliseconds since the previous record, kind and
+    arguments. Only the data the plugin uses is kept, see read_recording.
+    Safe to call from any thread.
+    """
+
+    def __init__(self, path, clock=monotonic):
+        self.path = path
+        self._clock = clock
+        self._file = gzip.open(path, 'wt', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._last = clock()
+        self.records = 0
+
+    def _write(self, kind, *args):
+        with self._lock:
+            if self._file is None:
+                return
+            now = self._clock()
+            delay = int(round((now - self._last) * 1000))
+            # Rounding errors are carried over to the next record.
+            self._last += delay / 1000
+            self._file.write(json.dumps([delay, kind] + list(args),
+                                        separators=(',', ':'), default=str))
+            self._file.write('\n')
+            self.records += 1
+
+    def event(self, event, payload):
+        self._write(EVENT, event, payload)
+
+    def temperature(self, data):
+        self._write(TEMPERATURE, {h: dict(actual=data[h]['actual'], target=data[h]['target'])
+                                  for h in HEATERS if h in data})
+
+    def current_data(self, data):
+        progress = data['progress']
+        printing = data.get('state', {}).get('flags', {}).get('printing', False)
+        self._write(CURRENT_DATA, progress['completion'], progress['printTimeLeft'], printing)
+
+    def gcode_sent(self, cmd, gcode):
+        # Only M117 lines are kept whole, the plugin ignores the others.
+        self._write(GCODE_SENT, gcode, cmd if gcode == 'M117' else None)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_recording(path):
+    """
+    Yields `(seconds, method, args)` for each record of a file written by
+    Recorder, seconds since the start and the plugin method with its
+    arguments as OctoPrint calls it.
+    """
+    seconds = 0
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            (delay, kind, *args) = json.loads(line)
+            seconds += delay / 1000
+            if kind == EVENT:
+                yield (seconds, 'on_event', args)
+            elif kind == TEMPERATURE:
+                yield (seconds, 'on_printer_add_temperature', args)
+            elif kind == CURRENT_DATA:
+                (completion, seconds_left, printing) = args
+                data = dict(
+                    progress=dict(completion=completion, printTimeLeft=seconds_left),
+                    state=dict(flags=dict(printing=printing)),
+                )
+                yield (seconds, 'on_printer_send_current_data', [data])
+            elif kind == GCODE_SENT:
+                (gcode, cmd) = args
+                yield (seconds, 'protocol_gcode_sent_hook',
+                       [None, 'sent', cmd or gcode, None, gcode])
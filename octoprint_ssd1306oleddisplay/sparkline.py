@@ -0,0 +1,121 @@
+from array import array
+from math import isnan, nan
+from time import monotonic
+
+from octoprint_ssd1306oleddisplay.helpers import HEATERS
+
+
+class RingBuffer:
+    """
+    Fixed size buffer of numbers backed by an array, the oldest value is
+    overwritten when full.
+    """
+
+    def __init__(self, size, typecode='f'):
+        self._values = array(typecode, [0]) * size
+        self._start = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        """ Values from oldest to newest. """
+        size = len(self._values)
+        for i in range(self._count):
+            yield self._values[(self._start + i) % size]
+
+    def append(self, value):
+        size = len(self._values)
+        self._values[(self._start + self._count) % size] = value
+        if self._count < size:
+            self._count += 1
+        else:
+            self._start = (self._start + 1) % size
+
+    def last(self):
+        """ Newest value, None if empty. """
+        if not self._count:
+            return None
+        return self._values[(self._start + self._count - 1) % len(self._values)]
+
+
+class Sparkline:
+    """
+    Graph of recent temperatures for one display row, one column per
+    `interval` seconds with the newest on the right.
+    Temperatures are kept in a ring buffer per heater, and the graph in a
+    circular buffer of columns, so adding a sample only draws one column
+    and memory use does not grow. Each column is `(height + 7) // 8` bytes,
+    top pixel in the most significant bit, see SSD1306.update_rows.
+    """
+
+    def __init__(self, width, height, interval, heaters=HEATERS, low=0, high=300, clock=monotonic):
+        self.interval = interval
+        self.low = low
+        self.high = high
+        self._heaters = heaters
+        self._clock = clock
+        self._next = None
+        self.resize(width, height)
+
+    def resize(self, width, height):
+        """ Change graph size, the graph is redrawn from the kept temperatures. """
+        history = getattr(self, '_history', {})
+        self.width = width
+        self.height = height
+        self._stride = (height + 7) // 8
+        self._columns = bytearray(width * self._stride)
+        # Column written next, the oldest one.
+        self._head = 0
+        self._history = {h: RingBuffer(width) for h in self._heaters}
+        samples = zip(*(history.get(h, ()) for h in self._heaters))
+        for sample in list(samples)[-width:]:
+            self.append(dict(zip(self._heaters, sample)))
+
+    def update(self, data):
+        """
+        Add a sample from OctoPrint temperature `data` if one is due.
+        Returns the graph columns if it changed, None otherwise.
+        """
+        now = self._clock()
+        if self._next is not None and now < self._next:
+            return None
+        self._next = now + self.interval
+        self.append({h: data[h]['actual'] for h in self._heaters if h in data})
+        return self.columns()
+
+    def append(self, temperatures):
+        """
+        Add a sample, `temperatures` maps heater to temperature. Each heater
+        is a dot, joined to its previous one by a vertical line.
+        """
+        column = bytearray(self._stride)
+        for (heater, history) in self._history.items():
+            value = temperatures.get(heater)
+            if value is not None and isnan(value):
+                value = None
+            previous = history.last()
+            history.append(nan if value is None else value)
+            if value is None:
+                continue
+            y = self._y(value)
+            top = bottom = y
+            if previous is not None and not isnan(previous):
+                top = min(y, self._y(previous))
+                bottom = max(y, self._y(previous))
+            for y in range(top, bottom + 1):
+                column[y // 8] |= 0x80 >> (y % 8)
+        start = self._head * self._stride
+        self._columns[start:start + self._stride] = column
+        self._head = (self._head + 1) % self.width
+
+    def _y(self, value):
+        """ Pixel row for a temperature, high temperatures at the top. """
+        scale = (self.high - value) / (self.high - self.low)
+        return min(self.height - 1, max(0, int(round(scale * (self.height - 1)))))
+
+    def columns(self):
+        """ Graph columns from oldest (left) to newest (right), as bytes. """
+        start = self._head * self._stride
+        return bytes(self._columns[start:] + self._columns[:start])
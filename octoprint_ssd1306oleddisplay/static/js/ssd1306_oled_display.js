@@ -0,0 +1,54 @@
+/*
+ * Shows what the OLED display shows in the navbar.
+ * The preview is polled with ETag revalidation, so unchanged frames are
+ * answered with 304 Not Modified and the image is only replaced when the
+ * ETag changes.
+ */
+$(function() {
+    function Ssd1306OledDisplayViewModel(parameters) {
+        var self = this;
+        var url = "plugin/ssd1306_oled_display/preview.png";
+        var interval = 1000;
+        var etag = null;
+
+        self.loginState = parameters[0];
+        self.src = ko.observable(null);
+
+        self.poll = function() {
+            if (document.hidden || !self.loginState.isUser()) {
+                setTimeout(self.poll, interval);
+                return;
+            }
+            fetch(url, {cache: "no-cache", credentials: "same-origin"})
+                .then(function(response) {
+                    if (!response.ok || response.headers.get("ETag") === etag) {
+                        return null;
+                    }
+                    etag = response.headers.get("ETag");
+                    return response.blob();
+                })
+                .then(function(blob) {
+                    if (blob) {
+                        if (self.src()) {
+                            URL.revokeObjectURL(self.src());
+                        }
+                        self.src(URL.createObjectURL(blob));
+                    }
+                })
+                .catch(function() {})
+                .then(function() {
+                    setTimeout(self.poll, interval);
+                });
+        };
+
+        self.onStartupComplete = function() {
+            self.poll();
+        };
+    }
+
+    OCTOPRINT_VIEWMODELS.push({
+        construct: Ssd1306OledDisplayViewModel,
+        dependencies: ["loginStateViewModel"],
+        elements: ["#navbar_plugin_ssd1306_oled_display"]
+    });
+});
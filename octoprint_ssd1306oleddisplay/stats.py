@@ -0,0 +1,33 @@
+from bisect import bisect_left
+
+# Upper bounds of histogram buckets, in milliseconds.
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class Histogram:
+    """ Fixed bucket histogram of durations, cheap enough for every frame. """
+
+    def __init__(self, buckets=BUCKETS_MS):
+        self._buckets = buckets
+        # Last bucket counts values larger than all bounds.
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        ms = seconds * 1000
+        self.counts[bisect_left(self._buckets, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def to_dict(self):
+        return dict(
+            count=self.count,
+            mean_ms=self.total / self.count if self.count else 0.0,
+            max_ms=self.max,
+            buckets_ms=list(self._buckets) + ['inf'],
+            counts=list(self.counts),
+        )
@@ -1,6 +1,14 @@
+import threading
 import pytest
-from time import sleep
+from time import monotonic, sleep
 from .SSD1306 import SSD1306
+from .backends import FakeBackend
+from .bus import Bus
+from .framebuffer import ImageFramebuffer, NumpyFramebuffer
+from .helpers import TemperatureFilter, changed_columns, changed_windows
+from .progress import ProgressBar
+from .sparkline import RingBuffer, Sparkline
+from .stats import Histogram
 
 # Simple test of SSD1306
 
@@ -11,6 +19,57 @@ refresh_rate = 120
 rows = round(height/fontsize)
 
 
+class FakeDisplay:
+    """ Stand-in for adafruit_ssd1306.SSD1306_I2C that records writes. """
+
+    def __init__(self, width=width, height=height, i2c=None, addr=0x3C):
+        self.width = width
+        self.height = height
+        self.buffer = bytearray((height // 8) * width + 1)
+        self.buffer[0] = 0x40
+        self.i2c_device = self
+        self.writes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def write(self, data):
+        self.writes.append(bytes(data))
+
+    def image(self, image):
+        pixels = image.load()
+        for page in range(self.height // 8):
+            for x in range(self.width):
+                bits = 0
+                for bit in range(8):
+                    if pixels[x, page * 8 + bit]:
+                        bits |= 1 << bit
+                self.buffer[1 + page * self.width + x] = bits
+
+
+class FlakyBackend(FakeBackend):
+    """ FakeBackend that fails while `fail` is set. """
+    fail = False
+
+    def open(self):
+        if self.fail:
+            raise IOError('No display')
+        super(FlakyBackend, self).open()
+
+    def data(self, data):
+        if self.fail:
+            raise IOError('No display')
+        super(FlakyBackend, self).data(data)
+
+
+def data_writes(backend):
+    """ Data transfers recorded by a FakeBackend. """
+    return [w for w in backend.writes if w[0] == 0x40]
+
+
 class TestSSD1306:
     display = SSD1306(
         width=width,
@@ -103,9 +162,509 @@ class TestSSD1306:
             self.display.commit()
             self.display.start()
             sleep(1/self.display._refresh_rate)
-            self.display._image.save('test/larger_font{}.png'.format(str(i)))
+            self.display.to_image().save('test/larger_font{}.png'.format(str(i)))
             self.display.clear_rows()
             self.display.stop()
 
+    def test_generation(self):
+        display = SSD1306(width=width, height=height, fontsize=fontsize)
+        display.write_row(0, 'Same')
+        display.commit()
+        assert display.get_stats()['generation'] == 1
+        assert display._dirty == {0}
+        # Committing unchanged rows should not create a new generation.
+        display.commit()
+        assert display.get_stats()['generation'] == 1
+        display.write_row(1, 'Other')
+        display.commit()
+        assert display.get_stats()['generation'] == 2
+        assert display._dirty == {0, 1}
+
+    def test_update_rows(self):
+        display = SSD1306(width=width, height=height, fontsize=fontsize)
+        display.write_row(3, 'Staged')
+        display.update_rows({0: 'Title', 1: 'State'})
+        assert display.get_stats()['generation'] == 1
+        assert display._dirty == {0, 1}
+        assert display._committed_rows == ['Title', 'State', '', '']
+        # Unchanged rows do not create a new generation.
+        display.update_rows({0: 'Title'})
+        assert display.get_stats()['generation'] == 1
+        # Nothing is written if any row is out of range.
+        with pytest.raises(IndexError):
+            display.update_rows({2: 'Lost', 99: ''})
+        assert display._rows[2] == ''
+        display.update_rows({1: 'Only'}, clear=True)
+        assert display.get_stats()['generation'] == 2
+        assert display._committed_rows == ['', 'Only', '', '']
+        assert display._dirty == {0, 1}
+
+    def test_skip_unchanged(self):
+        display = SSD1306(width=width, height=height,
+                          fontsize=fontsize, refresh_rate=refresh_rate,
+                          backend=FakeBackend(width, height))
+        display.write_row(0, 'Frame')
+        display.commit()
+        display.start()
+        sleep(10/refresh_rate)
+        display.commit()
+        sleep(10/refresh_rate)
+        assert display.get_stats()['frames_rendered'] == 1
+        assert len(data_writes(display._backend)) == 1
+        display.stop()
+        display.join(1)
+        assert not display.is_alive()
+
+    def test_coalesce_commits(self):
+        display = SSD1306(width=width, height=height,
+                          fontsize=fontsize, refresh_rate=4,
+                          backend=FakeBackend(width, height))
+        display.start()
+        # First commit is shown without waiting for a refresh tick.
+        display.write_row(0, 'First')
+        display.commit()
+        sleep(0.1)
+        assert display.get_stats()['frames_rendered'] == 1
+        # A burst of commits within one frame interval share one frame.
+        for i in range(0, 5):
+            display.write_row(1, str(i))
+            display.commit()
+        sleep(0.5)
+        stats = display.get_stats()
+        assert stats['frames_rendered'] == 2
+        assert stats['frames_skipped'] == 4
+        display.stop()
+
+    def test_changed_windows(self):
+        old = bytearray(2 * 8)
+        new = bytearray(old)
+        assert changed_windows(old, new, 8, 2) == []
+        new[8 + 2] = 1
+        new[8 + 5] = 1
+        assert changed_windows(old, new, 8, 2) == [(1, 2, 5)]
+        new[0] = 1
+        assert changed_windows(old, new, 8, 2) == [(0, 0, 0), (1, 2, 5)]
+
+    def test_partial_update(self):
+        backend = FakeBackend(width, height)
+        display = SSD1306(width=width, height=height,
+                          fontsize=fontsize, backend=backend)
+        display._init_display()
+        for i in range(0, rows):
+            display.write_row(i, 'Line {}'.format(i))
+        display._draw_rows(dict(enumerate(display._rows)))
+        display._send_image()
+        assert len(data_writes(backend)) == 1
+        full = display.get_stats()['bytes_sent']
+        # Change only the third row, only that page should be sent.
+        backend.writes = []
+        display._draw_rows({2: 'Line X'})
+        display._send_image()
+        (commands, data) = backend.writes
+        assert commands[0] == 0x00 and commands[4:] == bytes([0x22, 2, 2])
+        assert data[0] == 0x40
+        assert len(data) - 1 == commands[3] - commands[2] + 1
+        assert display.get_stats()['bytes_sent'] - full < full / 4
+        # Display RAM matches the framebuffer.
+        assert backend.ram == display._buffer
+
+    def test_glyph_atlas(self):
+        from PIL import Image, ImageDraw
+        display = SSD1306(width=width, height=height, fontsize=fontsize)
+        atlas = display._atlas
+        preloaded = len(atlas)
+        text = 'Nečum! B:60ok'
+        expected = Image.new('1', (width, fontsize))
+        ImageDraw.Draw(expected).text(
+            (0, 0), text, font=display._font, fill=200)
+        image = Image.new('1', (width, fontsize))
+        atlas.blit(image, text)
+        assert image.tobytes() == expected.tobytes()
+        # Unseen characters are added lazily.
+        assert len(atlas) == preloaded + 1
+
+    def test_row_cache(self):
+        display = SSD1306(width=width, height=height,
+                          fontsize=fontsize, row_cache_size=2)
+        first = display._row_strip('pCat')
+        assert display._row_strip('pCat') is first
+        display._row_strip('Operational')
+        display._row_strip('Printing')
+        stats = display.get_stats()['row_cache']
+        assert stats['hits'] == 1
+        assert stats['misses'] == 3
+        assert stats['evictions'] == 1
+        assert stats['size'] == 2
+        # Least recently used entry was evicted.
+        assert display._row_strip('pCat') is not first
+
+    def test_temperature_interval(self):
+        now = [0]
+        temps = TemperatureFilter(min_interval=2, clock=lambda: now[0])
+        assert temps.update(dict(tool0=dict(actual=208, target=210))) == 'T0:208ok'
+        now[0] = 1
+        assert temps.update(dict(tool0=dict(actual=150, target=210))) is None
+        now[0] = 2
+        assert temps.update(dict(tool0=dict(actual=150, target=210))) == 'T0:150+'
+        assert temps.get_stats() == dict(received=3, committed=2)
+
+    @pytest.mark.parametrize('framebuffer', [ImageFramebuffer, NumpyFramebuffer])
+    @pytest.mark.parametrize('size', [(128, 32), (128, 64), (64, 48)])
+    def test_framebuffer_pack(self, framebuffer, size):
+        if framebuffer is NumpyFramebuffer:
+            pytest.importorskip('numpy')
+        from PIL import Image, ImageDraw
+        image = Image.new('1', size)
+        ImageDraw.Draw(image).ellipse((2, 3, size[0] - 5, size[1] - 1), outline=1)
+        reference = FakeDisplay(*size)
+        reference.image(image)
+        fb = framebuffer(*size)
+        fb.blit(fb.strip(image), 0)
+        buffer = bytearray(len(reference.buffer) - 1)
+        fb.pack(memoryview(buffer))
+        assert buffer == reference.buffer[1:]
+        assert fb.to_image().tobytes() == image.tobytes()
+
+    def test_ring_buffer(self):
+        buffer = RingBuffer(3)
+        assert buffer.last() is None
+        for value in range(5):
+            buffer.append(value)
+        assert len(buffer) == 3
+        assert list(buffer) == [2, 3, 4]
+        assert buffer.last() == 4
+
+    def test_sparkline(self):
+        now = [0]
+        sparkline = Sparkline(4, 8, interval=10, heaters=['bed', 'tool0'],
+                              low=0, high=70, clock=lambda: now[0])
+        columns = sparkline.update(dict(bed=dict(actual=0, target=0)))
+        assert columns == bytes([0, 0, 0, 0b00000001])
+        # Samples are taken once per interval.
+        assert sparkline.update(dict(bed=dict(actual=70, target=0))) is None
+        now[0] = 10
+        columns = sparkline.update(dict(bed=dict(actual=70, target=0),
+                                        tool0=dict(actual=30, target=0)))
+        # Bed is joined to its previous reading, tool0 is a dot.
+        assert columns == bytes([0, 0, 0b00000001, 0b11111111])
+        # Memory does not grow, the oldest columns are overwritten.
+        for i in range(100):
+            sparkline.append(dict(bed=i % 70))
+        assert len(sparkline._columns) == 4
+        assert len(sparkline._history['bed']) == 4
+        # Resizing redraws from the kept temperatures.
+        columns = sparkline.columns()
+        sparkline.resize(4, 8)
+        assert sparkline.columns() == columns
+
+    @pytest.mark.parametrize('use_numpy', [False, True])
+    def test_graphic_row(self, use_numpy):
+        if use_numpy:
+            pytest.importorskip('numpy')
+        display = SSD1306(width=width, height=height, fontsize=fontsize,
+                          use_numpy=use_numpy)
+        columns = bytes([0b10000000, 0b00000001]) + bytes(width - 2)
+        display.update_rows({2: columns})
+        display._draw_rows({2: display._committed_rows[2]})
+        image = display.to_image()
+        assert image.getpixel((0, 2 * fontsize)) and image.getpixel((1, 3 * fontsize - 1))
+        assert sum(image.convert('L').tobytes()) == 2 * 255
+
+    @pytest.mark.parametrize('use_numpy', [False, True])
+    def test_graphic_row_changed_columns(self, use_numpy):
+        if use_numpy:
+            pytest.importorskip('numpy')
+        display = SSD1306(width=width, height=height, fontsize=fontsize,
+                          use_numpy=use_numpy)
+        blits = []
+        blit = display._framebuffer.blit
+        display._framebuffer.blit = lambda strip, y, x=0: blits.append(x) or blit(strip, y, x)
+        columns = bytearray(width)
+        display._draw_rows({2: bytes(columns)})
+        columns[40:43] = b'\xff\xff\xff'
+        display._draw_rows({2: bytes(columns)})
+        display._draw_rows({2: bytes(columns)})
+        # Only the changed columns are drawn again.
+        assert blits == [0, 40]
+        image = display.to_image()
+        assert sum(image.convert('L').tobytes()) == 3 * fontsize * 255
+        # Text replaces the graphic.
+        display._draw_rows({2: ''})
+        display._draw_rows({2: bytes(columns)})
+        assert blits[-1] == 0
+
+    def test_progress_bar(self):
+        atlas = SSD1306(width=width, height=height, fontsize=fontsize)._atlas
+        bar = ProgressBar(width, fontsize, atlas)
+        # Bar on the left, time left on the right.
+        empty = bar.update(0, 630)
+        assert empty[0] == empty[bar._inside + 1] == 0b01111110
+        assert empty[1:bar._inside + 1] == bytes([0b01000010]) * bar._inside
+        assert any(empty[-atlas.text_width('10m'):])
+        # The same minute and filled columns change nothing.
+        assert bar.update(0.5, 610) is None
+        half = bar.update(50, 610)
+        assert changed_columns(empty, half, 1) == (1, bar._inside // 2 + 1)
+        assert half[1] == 0b01111110
+        # The time left is drawn again when its minute changes.
+        eta = bar.update(50, 590)
+        (first, _) = changed_columns(half, eta, 1)
+        assert first >= bar._inside + 2
+        # A new print empties the bar.
+        assert bar.update(0, None)[1:bar._inside + 1] == empty[1:bar._inside + 1]
+
+    def test_histogram(self):
+        histogram = Histogram(buckets=(1, 10))
+        for seconds in (0.0005, 0.001, 0.005, 0.5):
+            histogram.record(seconds)
+        stats = histogram.to_dict()
+        assert stats['counts'] == [2, 1, 1]
+        assert stats['count'] == 4
+        assert stats['max_ms'] == 500
+
+    def test_reconnect_with_backoff(self):
+        backend = FlakyBackend(width, height)
+        backend.fail = True
+        display = SSD1306(width=width, height=height, fontsize=fontsize,
+                          refresh_rate=refresh_rate, backend=backend,
+                          retry_min=0.05, retry_max=0.2)
+        display.write_row(0, 'Waiting')
+        display.commit()
+        display.start()
+        sleep(0.5)
+        stats = display.get_stats()
+        assert stats['state'] == 'down'
+        assert stats['frames_rendered'] == 0
+        # Retried after 0, 0.05, 0.1, 0.2 and then every 0.2 seconds.
+        assert 3 <= display._backoff / 0.05 <= 4
+        assert display._backoff == 0.2
+        backend.fail = False
+        sleep(0.3)
+        stats = display.get_stats()
+        assert stats['state'] == 'up'
+        assert stats['frames_rendered'] == 1
+        assert stats['reconnects'] == 0
+        assert backend.ram == display._buffer
+        # Failing transfer takes the display down, it is fully redrawn
+        # after reconnecting.
+        backend.fail = True
+        display.write_row(1, 'Lost')
+        display.commit()
+        sleep(0.1)
+        assert display.get_stats()['state'] == 'down'
+        assert display.get_stats()['bus_errors'] == 1
+        backend.fail = False
+        sleep(0.3)
+        stats = display.get_stats()
+        assert stats['state'] == 'up'
+        assert stats['reconnects'] == 1
+        assert backend.ram == display._buffer
+        assert display._committed_rows[1] == 'Lost'
+        display.stop()
+
+    def test_reconfigure_during_init(self):
+        replacement = FakeBackend(width, height)
+
+        class SlowBackend(FakeBackend):
+            def open(self):
+                # Backend replaced while the display is initialized.
+                threading.Thread(target=display.reconfigure,
+                                 kwargs=dict(backend=replacement)).start()
+                sleep(0.1)
+                super(SlowBackend, self).open()
+        display = SSD1306(width=width, height=height, fontsize=fontsize,
+                          refresh_rate=refresh_rate, backend=SlowBackend(width, height))
+        display.start()
+        deadline = monotonic() + 5
+        while not replacement.opened and monotonic() < deadline:
+            sleep(0.05)
+        sleep(0.05)
+        assert display._backend is replacement
+        assert replacement.opened == 1
+        assert display.get_stats()['state'] == 'up'
+        display.stop()
+
+    def test_draw_error(self):
+        backend = FakeBackend(width, height)
+        display = SSD1306(width=width, height=height, fontsize=fontsize,
+                          refresh_rate=refresh_rate, backend=backend)
+        draw_rows = display._draw_rows
+        failures = []
+
+        def fail_once(rows):
+            if not failures:
+                failures.append(rows)
+                raise ValueError('Broken glyph')
+            draw_rows(rows)
+        display._draw_rows = fail_once
+        display.start()
+        display.update_rows({0: 'First', 1: 'Frame'})
+        sleep(0.2)
+        # The render thread keeps running and the next frame shows all rows.
+        assert failures
+        assert display.is_alive()
+        assert display.get_stats()['frames_rendered'] == 1
+        assert backend.ram == display._buffer
+        assert display._buffer != bytearray(len(display._buffer))
+        display.stop()
+
+    def test_step_with_clock(self):
+        now = [100]
+        backend = FakeBackend(width, height)
+        display = SSD1306(width=width, height=height, fontsize=fontsize,
+                          refresh_rate=2, backend=backend, dim_after=10,
+                          clock=lambda: now[0])
+        assert display._has_work()
+        display._step()
+        assert display.get_stats()['state'] == 'up'
+        display.update_rows({0: 'First'})
+        display._step()
+        assert display.get_stats()['frames_rendered'] == 1
+        # The next frame waits for the refresh rate.
+        display.update_rows({0: 'Second'})
+        assert not display._has_work()
+        assert display._wait_delay() == 0.5
+        now[0] = 100.5
+        assert display._has_work()
+        display._step()
+        assert display.get_stats()['frames_rendered'] == 2
+        assert display._wait_delay() == 9.5
+        now[0] = 110
+        display._step()
+        assert display.get_stats()['power'] == 'dim'
+
+    def test_idle_power(self):
+        backend = FakeBackend(width, height)
+        display = SSD1306(width=width, height=height, fontsize=fontsize,
+                          refresh_rate=refresh_rate, backend=backend,
+                          dim_after=0.1, off_after=0.2)
+        display.start()
+        display.update_rows({0: 'Idle'})
+        sleep(0.15)
+        assert display.get_stats()['power'] == 'dim'
+        assert backend.contrast == 0x10
+        assert backend.on
+        sleep(0.1)
+        assert display.get_stats()['power'] == 'off'
+        assert not backend.on
+        # Nothing is sent while the display is off.
+        writes = len(backend.writes)
+        display.update_rows({1: 'Hidden'})
+        sleep(0.05)
+        assert len(backend.writes) == writes
+        display.wake()
+        sleep(0.05)
+        assert display.get_stats()['power'] == 'on'
+        assert backend.on
+        assert backend.contrast == 0xFF
+        assert backend.ram == display._buffer
+        assert display._committed_rows[1] == 'Hidden'
+        display.stop()
+
+    def test_idle_power_reconfigured(self):
+        backend = FakeBackend(width, height)
+        display = SSD1306(width=width, height=height, fontsize=fontsize,
+                          refresh_rate=refresh_rate, backend=backend)
+        display.start()
+        display.update_rows({0: 'Idle'})
+        sleep(0.1)
+        # The thread waits without timeout until the timeouts are set.
+        display.reconfigure(dim_after=0.3, off_after=0.6)
+        deadline = monotonic() + 5
+        while display.get_stats()['power'] != 'off' and monotonic() < deadline:
+            sleep(0.05)
+        assert display.get_stats()['power'] == 'off'
+        assert not backend.on
+        display.stop()
+
+    @pytest.mark.parametrize('use_numpy', [False, True])
+    def test_marquee(self, use_numpy):
+        if use_numpy:
+            pytest.importorskip('numpy')
+        backend = FakeBackend(width, height)
+        display = SSD1306(width=width, height=height, fontsize=fontsize,
+                          refresh_rate=1, backend=backend, use_numpy=use_numpy,
+                          scroll_rate=20, scroll_step=8)
+        text = 'Error! Thermal runaway, system stopped'
+        display.start()
+        display.update_rows({0: 'Short', 1: text})
+        deadline = monotonic() + 5
+        while display.get_stats()['frames_scrolled'] < 3 and monotonic() < deadline:
+            sleep(0.05)
+        # Hold the render thread while checking.
+        with display._render_lock:
+            stats = display.get_stats()
+            # Scrolling does not wait for the refresh rate and only sends the
+            # page of the scrolling row.
+            assert stats['frames_rendered'] == 1
+            assert stats['frames_scrolled'] >= 3
+            assert {write[5] for write in backend.writes[2::2]} == {1}
+            assert list(display._marquees) == [1]
+            # Strip is rendered once, each step is a window into it.
+            (strip, period, offset) = display._marquees[1]
+            assert display._marquee_strip(text)[0] is strip
+            assert period == (len(text) + 3) * fontsize
+            assert offset == (stats['frames_scrolled'] * 8) % period
+            assert backend.ram == display._buffer
+        # Short text stops scrolling.
+        display.update_rows({1: 'Done'})
+        sleep(1.1)
+        assert display._marquees == {}
+        display.stop()
+
+    def test_bus_priority(self):
+        bus = Bus(max_utilization=1)
+        order = []
+
+        def transfer(name, urgent):
+            with bus.transfer(urgent):
+                order.append(name)
+        with bus.transfer():
+            threads = [threading.Thread(target=transfer, args=args)
+                       for args in (('normal', False), ('urgent', True))]
+            for thread in threads:
+                thread.start()
+                sleep(0.05)
+        for thread in threads:
+            thread.join(1)
+        # Urgent transfers go first, even if requested later.
+        assert order == ['urgent', 'normal']
+        assert bus.get_stats()['transfers'] == dict(urgent=1, normal=2)
+
+    def test_bus_utilization(self):
+        bus = Bus(max_utilization=0.25, burst=0)
+        start = monotonic()
+        for i in range(3):
+            with bus.transfer():
+                sleep(0.02)
+        # Each transfer is followed by three times as long without one.
+        assert monotonic() - start >= 0.02 * 3 + 0.06 * 2 - 0.01
+        assert bus.get_stats()['throttled'] == 2
+        with bus.transfer(urgent=True):
+            pass
+        assert bus.get_stats()['throttled'] == 2
+
+    def test_shared_bus(self):
+        bus = Bus(max_utilization=1)
+        backends = [FakeBackend(width, height), FakeBackend(width, height)]
+        displays = [SSD1306(width=width, height=height, fontsize=fontsize,
+                            refresh_rate=1, backend=backend, bus=bus)
+                    for backend in backends]
+        for display in displays:
+            display.start()
+        sleep(0.1)
+        displays[0].update_rows({0: 'Periodic'})
+        displays[1].update_rows({0: 'Error!'}, urgent=True)
+        sleep(0.1)
+        # After the first frames, the urgent one is not held back by the
+        # refresh rate.
+        assert displays[1].get_stats()['frames_rendered'] == 2
+        assert displays[0].get_stats()['frames_rendered'] == 1
+        for (display, backend) in zip(displays, backends):
+            display.stop()
+            display.join(1)
+            assert backend.ram == bytes(len(backend.ram))
+        assert bus.get_stats()['transfers']['urgent'] >= 3
+
     def test_log(self):
         assert self.display.log('Test') == None
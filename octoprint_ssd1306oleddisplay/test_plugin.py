@@ -0,0 +1,656 @@
+import io
+import logging
+import os
+import subprocess
+import sys
+import threading
+import types
+from time import monotonic, sleep
+
+import adafruit_ssd1306
+import board
+import busio
+import pytest
+
+from . import Ssd1306_oled_displayPlugin
+from .backends import FakeBackend, I2CBackend
+from .layout import SOURCES, Layout
+from .network import IPAddressProvider
+from .test_SSD1306 import FakeDisplay
+
+# Tests of the plugin callbacks, without OctoPrint running.
+
+
+class FakeSettings:
+    """ Minimal stand-in for OctoPrint's plugin settings. """
+
+    def __init__(self, **values):
+        self.values = Ssd1306_oled_displayPlugin().get_settings_defaults()
+        self.values.update(values)
+
+    def get(self, path):
+        return self.values[path[0]]
+
+    def get_int(self, path):
+        return int(self.values[path[0]])
+
+    def get_float(self, path):
+        value = self.values[path[0]]
+        return None if value is None else float(value)
+
+    def get_boolean(self, path):
+        return bool(self.values[path[0]])
+
+    def set(self, path, value):
+        if path:
+            self.values[path[0]] = value
+        else:
+            # Replaces all data, values not set fall back to defaults.
+            self.clean_all_data()
+            self.values.update(value)
+
+    def get_all_data(self):
+        return dict(self.values)
+
+    def clean_all_data(self):
+        self.values = Ssd1306_oled_displayPlugin().get_settings_defaults()
+
+
+def create_plugin(**settings):
+    plugin = Ssd1306_oled_displayPlugin()
+    plugin._settings = FakeSettings(**settings)
+    plugin._logger = logging.getLogger('test_plugin')
+    return plugin
+
+
+class FakePrinter:
+    def register_callback(self, callback):
+        pass
+
+    def unregister_callback(self, callback):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def buses(monkeypatch):
+    """
+    Replace display hardware with fakes, returns the threads that opened
+    bus handles.
+    """
+    buses = []
+
+    def i2c(scl, sda, frequency=100000):
+        buses.append(threading.current_thread())
+        handle = types.SimpleNamespace(frequency=frequency, deinited=False)
+        handle.deinit = lambda: setattr(handle, 'deinited', True)
+        return handle
+
+    monkeypatch.setattr(board, 'SCL', 3, raising=False)
+    monkeypatch.setattr(board, 'SDA', 2, raising=False)
+    monkeypatch.setattr(busio, 'I2C', i2c)
+    monkeypatch.setattr(
+        adafruit_ssd1306, 'SSD1306_I2C',
+        FakeDisplay)
+    return buses
+
+
+def start_plugin(**settings):
+    plugin = create_plugin(**settings)
+    plugin._printer = FakePrinter()
+    plugin.on_after_startup()
+    return plugin
+
+
+def wait_for_rows(display):
+    """ Wait until the display worker shows the current rows, returns its frame. """
+    deadline = monotonic() + 20
+    while monotonic() < deadline:
+        # Asked after the rows were sent, so the worker has them.
+        stats = display.get_stats(timeout=1)
+        if stats.get('generation') and stats['sent_generation'] == stats['generation']:
+            return display.get_frame()
+        sleep(0.1)
+    raise AssertionError('Rows not shown by worker')
+
+
+def run_python(code):
+    """ Run code in a new interpreter, to measure a clean import. """
+    result = subprocess.run(
+        [sys.executable, '-c', code], capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.returncode == 0, result.stderr
+    return result
+
+
+class TestPlugin:
+
+    def test_gcode_hook_ignores_other_commands(self):
+        plugin = start_plugin()
+        for gcode in ('G1', 'M104', None):
+            plugin.protocol_gcode_sent_hook(
+                None, 'sent', 'G1 X1', None, gcode)
+        assert len(plugin.display._calls) == 0
+        plugin.on_shutdown()
+
+    def test_gcode_hook_m117(self):
+        plugin = start_plugin(refreshrate=100)
+        plugin.protocol_gcode_sent_hook(
+            None, 'sent', 'M117 Hello printer world', None, 'M117')
+        sleep(0.2)
+        # Messages longer than the row are shown in full and scroll.
+        assert plugin.display._committed_rows[1] == 'Hello printer world'
+        assert 1 in plugin.display._marquees
+        plugin.on_shutdown()
+
+    def test_gcode_hook_without_display(self):
+        plugin = create_plugin()
+        assert plugin.protocol_gcode_sent_hook(
+            None, 'sent', 'M117 Test', None, 'M117') is None
+
+    def test_settings_save_reuses_thread_and_bus(self, buses):
+        plugin = start_plugin(refreshrate=100)
+        display = plugin.display
+        plugin._set_values(job='Kept')
+        threads = threading.active_count()
+        for height in (64, 32, 64):
+            plugin.on_settings_save(dict(height=height, fontsize=8))
+            sleep(0.05)
+            assert plugin.display is display
+            assert threading.active_count() == threads
+            assert buses.count(display) == 1
+        assert display._height == 64
+        assert len(display._rows) == 8
+        assert display._committed_rows[3] == 'Kept'
+        plugin.on_settings_save(dict(fontsize=16))
+        assert len(display._rows) == 4
+        assert display._committed_rows[3] == 'Kept'
+        plugin.on_shutdown()
+
+    def test_import_does_no_name_resolution(self):
+        # Fail if the plugin resolves names while being imported.
+        code = '\n'.join([
+            'import socket, time',
+            'def fail(*args): raise AssertionError("resolver used")',
+            'socket.gethostbyname = socket.getaddrinfo = fail',
+            'start = time.perf_counter()',
+            'import octoprint_ssd1306oleddisplay',
+            'print(time.perf_counter() - start)',
+        ])
+        result = run_python(code)
+        print('Plugin import took {:.3f} s'.format(
+            float(result.stdout.splitlines()[-1])))
+
+    def test_import_time(self):
+        # Display drivers, PIL and the font are only loaded on startup.
+        code = '\n'.join([
+            'import sys, time',
+            'start = time.perf_counter()',
+            'import octoprint_ssd1306oleddisplay',
+            'elapsed = time.perf_counter() - start',
+            'deferred = ["adafruit_ssd1306", "busio", "board", "PIL"]',
+            'print(",".join(m for m in deferred if m in sys.modules))',
+            'print(elapsed)',
+        ])
+        result = run_python(code)
+        (loaded, elapsed) = result.stdout.splitlines()[-2:]
+        assert loaded == ''
+        print('Plugin import took {:.3f} s'.format(float(elapsed)))
+
+    def test_ip_address_lookup_in_background(self):
+        def slow_lookup():
+            sleep(0.5)
+            return '192.0.2.1'
+
+        plugin = create_plugin(showip=True)
+        plugin._ip_address = IPAddressProvider(
+            plugin._on_ip_address, lookup=slow_lookup)
+        plugin._printer = FakePrinter()
+        start = monotonic()
+        plugin.on_after_startup()
+        # Startup does not wait for the lookup.
+        assert monotonic() - start < 0.5
+        assert plugin.display._committed_rows[0] == 'pCat'
+        sleep(1)
+        assert plugin.display._committed_rows[0] == '192.0.2.1'
+        plugin.on_shutdown()
+
+    def test_temperature_coalescing(self):
+        plugin = start_plugin(tempinterval=0)
+
+        def temps(bed, target=60):
+            return dict(bed=dict(actual=bed, target=target))
+        plugin.on_printer_add_temperature(temps(20.0))
+        assert plugin.display._rows[2] == 'B:20+'
+        # Sub-degree jitter is ignored.
+        for bed in (20.4, 20.9, 20.2):
+            plugin.on_printer_add_temperature(temps(bed))
+        assert plugin._temperatures.get_stats() == dict(
+            received=4, committed=1)
+        plugin.on_printer_add_temperature(temps(21.5))
+        assert plugin.display._rows[2] == 'B:21+'
+        # A new target is always shown.
+        plugin.on_printer_add_temperature(temps(21.5, target=0))
+        assert plugin.display._rows[2] == 'B:21'
+        assert plugin._temperatures.get_stats() == dict(
+            received=6, committed=3)
+        plugin.on_shutdown()
+
+    def test_temperature_sparkline(self):
+        plugin = start_plugin(height=64, sparklineminutes=0,
+                              layout='{title}\n{status}\n{temps}\n{job}\n{sparkline}')
+        plugin.on_printer_add_temperature(dict(bed=dict(actual=60, target=60)))
+        columns = plugin.display._committed_rows[4]
+        assert isinstance(columns, bytes) and len(columns) == 128
+        assert plugin.display._committed_rows[2] == 'B:60ok'
+        # Disabled when no row shows it.
+        plugin.on_settings_save(dict(layout='{temps}'))
+        assert plugin._sparkline is None
+        plugin.on_shutdown()
+
+    def test_progress_bar(self):
+        plugin = start_plugin(layout='{title}\n{progressbar}\n{job}', refreshrate=100)
+        display = plugin.display
+
+        def progress(completion, seconds_left):
+            plugin.on_printer_send_current_data(dict(
+                progress=dict(completion=completion, printTimeLeft=seconds_left)))
+        progress(12, 3010)
+        columns = display._committed_rows[1]
+        assert isinstance(columns, bytes) and len(columns) == 128
+        # Progress too small to fill a column only changes the text row.
+        generation = display.get_stats()['generation']
+        progress(13, 3005)
+        assert display._committed_rows[1] == columns
+        assert display.get_stats()['generation'] == generation + 1
+        progress(60, 1200)
+        assert display._committed_rows[1] != columns
+        # Kept when the graph is resized.
+        plugin.on_settings_save(dict(width=64))
+        assert plugin._progressbar.completion == 60
+        assert len(display._committed_rows[1]) == 64
+        plugin.on_settings_save(dict(layout='{job}'))
+        assert plugin._progressbar is None
+        plugin.on_shutdown()
+
+    def test_record_callbacks(self, tmp_path):
+        from .recording import read_recording
+        path = str(tmp_path / 'print.jsonl.gz')
+        plugin = start_plugin(recordfile=path)
+        plugin.on_event('PrinterStateChanged', dict(state_string='Printing'))
+        plugin.on_printer_add_temperature(dict(
+            bed=dict(actual=60.5, target=60, offset=0), time=1))
+        plugin.on_printer_send_current_data(dict(
+            progress=dict(completion=5, printTimeLeft=600, printTime=30),
+            state=dict(flags=dict(printing=True)), job={}))
+        plugin.protocol_gcode_sent_hook(None, 'sent', 'G1 X10', None, 'G1')
+        plugin.protocol_gcode_sent_hook(None, 'sent', 'M117 Hello', None, 'M117')
+        plugin.on_shutdown()
+        records = list(read_recording(path))
+        assert [method for (_, method, _) in records] == [
+            'on_event', 'on_printer_add_temperature', 'on_printer_send_current_data',
+            'protocol_gcode_sent_hook', 'protocol_gcode_sent_hook']
+        assert records[0][2] == ['PrinterStateChanged', dict(state_string='Printing')]
+        # Only what the plugin uses is kept.
+        assert records[1][2] == [dict(bed=dict(actual=60.5, target=60))]
+        assert records[2][2] == [dict(progress=dict(completion=5, printTimeLeft=600),
+                                      state=dict(flags=dict(printing=True)))]
+        assert records[3][2] == [None, 'sent', 'G1', None, 'G1']
+        assert records[4][2] == [None, 'sent', 'M117 Hello', None, 'M117']
+        assert all(seconds < 1 for (seconds, _, _) in records)
+
+    def test_layout(self):
+        layout = Layout('{state} {progress:>4}\n{{literal}}\n{eta}\n---\n{sparkline}\nIgnored', 1)
+        assert len(layout.pages) == 2
+        values = dict.fromkeys(SOURCES, '')
+        values.update(state='Printing', progress='5%', sparkline=b'\x01')
+        assert layout.render(0, values) == {0: 'Printing   5%'}
+        # Only rows using changed sources, on the given page.
+        assert layout.render(0, values, ['temps']) == {}
+        assert layout.render(1, values, ['state']) == {}
+        assert layout.render(1, values, ['sparkline']) == {0: b'\x01'}
+        assert layout.uses('sparkline') and not layout.uses('eta')
+        with pytest.raises(ValueError):
+            Layout('{nozzle}', 4)
+        with pytest.raises(ValueError):
+            Layout('Graph {sparkline}', 4)
+
+    def test_layout_pages(self):
+        plugin = start_plugin(layout='{state}\n{job}\n---\n{temps}', pageinterval=3600)
+        display = plugin.display
+        plugin.on_event('PrinterStateChanged', dict(state_string='Printing'))
+        assert display._committed_rows[:2] == ['Printing', '']
+        generation = display.get_stats()['generation']
+        # Sources not on the shown page do not update the display.
+        plugin._set_values(temps='B:60')
+        assert display.get_stats()['generation'] == generation
+        plugin._next_page()
+        assert display._committed_rows[:2] == ['B:60', '']
+        plugin._next_page()
+        assert display._committed_rows[:2] == ['Printing', '']
+        # An invalid layout falls back to the default one.
+        plugin.on_settings_save(dict(layout='{nozzle}'))
+        assert len(plugin._panels[0].layout.pages) == 1
+        assert display._committed_rows[1] == 'Printing'
+        plugin.on_shutdown()
+
+    def test_panels(self, buses):
+        plugin = start_plugin(
+            backend='i2c', refreshrate=1,
+            panels=[dict(i2caddress=0x3D, layout='{message}\n{temps}', refreshrate=100)])
+        (first, second) = [panel.display for panel in plugin._panels]
+        assert plugin.display is first
+        sleep(0.1)
+        # Both displays use one bus handle, through the scheduler.
+        assert [backend.address for backend in (first._backend, second._backend)] == [0x3C, 0x3D]
+        assert first._backend.i2c is second._backend.i2c
+        assert len(buses) == 1
+        assert first._bus is second._bus is plugin._bus
+        plugin._show_message('M117 Layer 2')
+        sleep(0.1)
+        assert second._committed_rows[:2] == ['Layer 2', '']
+        assert first._committed_rows[1] == 'Layer 2'
+        stats = plugin.get_stats()
+        assert len(stats['panels']) == 1
+        assert stats['panels'][0]['frames_rendered'] >= 2
+        # The message is sent without waiting for the refresh rate.
+        assert stats['display']['frames_rendered'] == 2
+        assert stats['bus']['transfers']['urgent'] >= 4
+        # Layouts of every panel are applied on save.
+        plugin.on_settings_save(dict(panels=[dict(layout='{state}')]))
+        assert second._committed_rows[:2] == ['', '']
+        plugin.on_shutdown()
+
+    def test_bus_utilization_settings(self, buses):
+        plugin = start_plugin(backend='i2c', panels=[dict(i2caddress=0x3D)], busutilization=0)
+        # Not a valid limit, the default is used.
+        assert plugin._bus.max_utilization == 0.5
+        plugin.on_settings_save(dict(busutilization=0.3))
+        assert plugin._bus.max_utilization == 0.3
+        # Rejected, the saved value is kept.
+        plugin.on_settings_save(dict(busutilization=0))
+        assert plugin._settings.get_float(['busutilization']) == 0.3
+        assert plugin._bus.max_utilization == 0.3
+        plugin.on_settings_save(dict(busutilization=2))
+        assert plugin._bus.max_utilization == 1
+        plugin.on_settings_save(dict(busutilization=None))
+        assert plugin._bus.max_utilization is None
+        assert plugin._bus._throttle_delay(monotonic()) == 0
+        plugin.on_shutdown()
+
+    def test_backend_from_settings(self, buses):
+        plugin = start_plugin(backend='fake', fakekhz=0)
+        sleep(0.1)
+        backend = plugin.display._backend
+        assert isinstance(backend, FakeBackend)
+        assert backend.opened == 1
+        assert buses.count(plugin.display) == 0
+        # Unrelated settings keep the backend.
+        plugin.on_settings_save(dict(refreshrate=10))
+        assert plugin.display._backend is backend
+        plugin.on_settings_save(dict(backend='i2c'))
+        sleep(0.1)
+        assert isinstance(plugin.display._backend, I2CBackend)
+        assert buses.count(plugin.display) == 1
+        plugin.on_shutdown()
+
+    def test_i2c_chunk_size(self):
+        backend = I2CBackend(128, 32, chunk_size=32)
+        backend.open()
+        backend._device.writes.clear()
+        backend.data(bytes(range(100)))
+        writes = backend._device.writes
+        assert [len(w) for w in writes] == [32, 32, 32, 8]
+        assert all(w[0] == 0x40 for w in writes)
+        assert b''.join(w[1:] for w in writes) == bytes(range(100))
+        assert backend.get_stats()['frequency'] == 100000
+
+    def test_i2c_shared_bus_reopened(self, buses, monkeypatch):
+        from adafruit_bus_device import i2c_device
+        from .bus import Bus
+        monkeypatch.setattr(i2c_device, 'I2CDevice',
+                            lambda i2c, address, probe=True: FakeDisplay())
+        bus = Bus(max_utilization=1)
+        fast = I2CBackend(128, 32, bus=bus, frequency=400000)
+        fast.open()
+        handle = fast.i2c
+        # A slower display opens the bus again, the faster one switches over.
+        slow = I2CBackend(128, 32, address=0x3D, bus=bus, frequency=100000)
+        slow.open()
+        assert len(buses) == 2
+        assert handle.deinited
+        fast.data(bytes(16))
+        assert fast.i2c is slow.i2c is bus.i2c
+        assert fast._device.writes == [bytes([0x40]) + bytes(16)]
+        assert fast.get_stats()['frequency'] == 100000
+        assert fast.write_errors == 0
+
+    def test_i2c_probe_and_fallback(self, monkeypatch):
+        import adafruit_ssd1306
+
+        class SlowBusDisplay(FakeDisplay):
+            """ Display that only works up to 400 kHz. """
+            fail = False
+
+            def __init__(self, width, height, i2c, addr=0x3C):
+                super(SlowBusDisplay, self).__init__(width, height, i2c, addr)
+                self.frequency = i2c.frequency
+
+            def write(self, data):
+                if self.frequency > 400000 or SlowBusDisplay.fail:
+                    raise OSError('No acknowledge')
+                super(SlowBusDisplay, self).write(data)
+        monkeypatch.setattr(adafruit_ssd1306, 'SSD1306_I2C', SlowBusDisplay)
+        backend = I2CBackend(128, 32, frequency=None)
+        backend.open()
+        assert backend.frequency == 400000
+        probe = backend.get_stats()['probe']
+        assert [(p['frequency'], p['errors']) for p in probe] == [(1000000, 10), (400000, 0)]
+        assert probe[1]['frames_per_second'] > 0
+        # Repeated errors make the next initialization use a slower clock.
+        SlowBusDisplay.fail = True
+        for i in range(3):
+            with pytest.raises(OSError):
+                backend.data(b'\x00')
+        SlowBusDisplay.fail = False
+        backend.open()
+        assert backend.frequency == 100000
+        assert backend._device.frequency == 100000
+        assert backend.get_stats()['fallbacks'] == 1
+        backend.data(b'\x00')
+        # A single error is not enough.
+        SlowBusDisplay.fail = True
+        with pytest.raises(OSError):
+            backend.data(b'\x00')
+        SlowBusDisplay.fail = False
+        backend.open()
+        assert backend.get_stats()['fallbacks'] == 1
+
+    def test_i2c_settings(self, buses):
+        plugin = start_plugin(i2cfrequency=0, i2cchunksize=64)
+        sleep(0.1)
+        # Probed on startup, the fake display works at any frequency.
+        stats = plugin.get_stats()['display']['backend']
+        assert (stats['frequency'], stats['chunk_size']) == (1000000, 64)
+        assert len(stats['probe']) == 1
+        plugin.on_settings_save(dict(i2cfrequency=400))
+        sleep(0.1)
+        assert plugin.display._backend.frequency == 400000
+        plugin.on_shutdown()
+
+    def test_unrelated_save_after_backend_change(self, buses):
+        plugin = start_plugin()
+        sleep(0.1)
+        plugin.on_settings_save(dict(i2caddress=0x3D))
+        sleep(0.1)
+        backend = plugin.display._backend
+        assert backend.address == 0x3D
+        opened = len(buses)
+        reconnects = plugin.display.get_stats()['reconnects']
+        for rate in (4, 8, 2):
+            plugin.on_settings_save(dict(scrollrate=rate))
+            sleep(0.05)
+            assert plugin.display._backend is backend
+        assert len(buses) == opened
+        assert plugin.display.get_stats()['reconnects'] == reconnects
+        plugin.on_shutdown()
+
+    def test_address_change_keeps_bus(self, buses):
+        plugin = start_plugin()
+        sleep(0.1)
+        handle = plugin.display._backend.i2c
+        plugin.on_settings_save(dict(i2caddress=0x3D, i2cchunksize=16))
+        sleep(0.1)
+        backend = plugin.display._backend
+        assert (backend.address, backend.chunk_size) == (0x3D, 16)
+        assert backend.i2c is handle
+        assert len(buses) == 1
+        assert not handle.deinited
+        # Another frequency needs a new handle, the old one is released.
+        plugin.on_settings_save(dict(i2cfrequency=400))
+        sleep(0.1)
+        assert len(buses) == 2
+        assert handle.deinited
+        plugin.on_shutdown()
+        backend = plugin.display._backend
+        backend.close()
+        assert backend.i2c is None
+
+    def test_spi_keeps_pins_between_retries(self, monkeypatch):
+        import digitalio
+        from .backends import SPIBackend
+        created = []
+
+        class Fake:
+            def __init__(self, *args, **kwargs):
+                self.deinited = False
+                created.append(self)
+
+            def deinit(self):
+                self.deinited = True
+        attempts = []
+
+        def display(width, height, spi, dc, reset, cs, baudrate):
+            attempts.append(spi)
+            if len(attempts) == 1:
+                raise OSError('No display')
+            return types.SimpleNamespace(spi_device=None)
+        for name in ('SCK', 'MOSI', 'D24', 'D25', 'CE0'):
+            monkeypatch.setattr(board, name, name, raising=False)
+        monkeypatch.setattr(digitalio, 'DigitalInOut', Fake)
+        monkeypatch.setattr(busio, 'SPI', Fake)
+        monkeypatch.setattr(adafruit_ssd1306, 'SSD1306_SPI', display)
+        backend = SPIBackend(128, 32)
+        with pytest.raises(OSError):
+            backend.open()
+        backend.open()
+        assert len(created) == 4
+        assert attempts[0] is attempts[1]
+        backend.close()
+        assert all(io.deinited for io in created)
+
+    def test_api_stats(self):
+        import flask
+        plugin = start_plugin(backend='fake', fakekhz=0, refreshrate=100)
+        plugin._update_display({1: 'Stats'})
+        sleep(0.1)
+        with flask.Flask(__name__).app_context():
+            stats = plugin.on_api_get(None).get_json()
+        display = stats['display']
+        assert display['frames_rendered'] >= 1
+        assert display['bytes_sent'] > 0
+        assert display['bus_errors'] == 0
+        for stage in ('compose', 'pack', 'transfer', 'latency'):
+            assert display['timings'][stage]['count'] >= 1
+        assert stats['temperatures'] == dict(received=0, committed=0)
+        plugin.on_shutdown()
+
+    def test_preview(self):
+        import flask
+        from PIL import Image
+        plugin = start_plugin(backend='fake', fakekhz=0, refreshrate=100)
+        plugin._update_display({1: 'Preview'})
+        sleep(0.1)
+        app = flask.Flask(__name__)
+        with app.test_request_context():
+            response = plugin.get_preview()
+            (etag, _) = response.get_etag()
+            image = Image.open(io.BytesIO(response.get_data()))
+        assert response.status_code == 200
+        assert image.size == (128, 32)
+        assert image.convert('1').tobytes() == plugin.display.to_image().tobytes()
+        # Polling an unchanged frame is not encoded again.
+        for i in range(5):
+            with app.test_request_context(headers={'If-None-Match': '"{}"'.format(etag)}):
+                assert plugin.get_preview().status_code == 304
+        plugin._update_display({1: 'Changed'})
+        sleep(0.1)
+        with app.test_request_context(headers={'If-None-Match': '"{}"'.format(etag)}):
+            assert plugin.get_preview().status_code == 200
+        assert plugin.get_stats()['preview'] == dict(encoded=2)
+        plugin.on_shutdown()
+
+    def test_preview_without_frame(self):
+        import flask
+        from werkzeug.exceptions import NotFound
+        plugin = create_plugin()
+        with flask.Flask(__name__).test_request_context():
+            with pytest.raises(NotFound):
+                plugin.get_preview()
+
+    def test_process_renderer(self):
+        from .process import ProcessDisplay
+        plugin = start_plugin(renderer='process', backend='fake', fakekhz=0,
+                              refreshrate=100)
+        display = plugin.display
+        assert isinstance(display, ProcessDisplay)
+        plugin._set_values(status='Worker')
+        frame = wait_for_rows(display)
+        assert frame[1:3] == (128, 32)
+        stats = plugin.get_stats()['display']
+        assert stats['frames_rendered'] >= 1
+        assert stats['worker']['restarts'] == 0
+        # A crashed worker is restarted and shows the current rows again.
+        display._worker.kill()
+        display._worker.join(5)
+        plugin._set_values(status='Restarted')
+        restarted = wait_for_rows(display)
+        assert restarted[0] > frame[0]
+        assert restarted[3] != frame[3]
+        assert plugin.get_stats()['display']['worker']['restarts'] == 1
+        plugin.on_shutdown()
+        assert not display._worker.is_alive()
+
+    def test_process_renderer_locked_memory(self):
+        plugin = start_plugin(renderer='process', backend='fake', fakekhz=0,
+                              refreshrate=100)
+        display = plugin.display
+        plugin._set_values(status='Worker')
+        frame = wait_for_rows(display)
+        # A worker killed while writing a frame leaves the memory locked.
+        display._shm_lock.acquire()
+        display._worker.kill()
+        display._worker.join(5)
+        start = monotonic()
+        plugin._set_values(status='Restarted')
+        assert display.get_frame() == frame
+        assert monotonic() - start < 5
+        # Statistics do not wait long for a worker that does not answer.
+        start = monotonic()
+        display.get_stats()
+        assert monotonic() - start < 0.5
+        # The rows are sent by the supervisor with the new worker.
+        restarted = wait_for_rows(display)
+        assert restarted[3] != frame[3]
+        assert plugin.get_stats()['display']['worker']['restarts'] == 1
+        plugin.on_shutdown()
+
+    def test_process_renderer_fallback(self, monkeypatch):
+        from . import process
+        from .SSD1306 import SSD1306
+
+        def fail(*args, **kwargs):
+            raise OSError('No shared memory')
+        monkeypatch.setattr(process, 'SharedMemory', fail)
+        plugin = start_plugin(renderer='process', backend='fake', fakekhz=0)
+        assert isinstance(plugin.display, SSD1306)
+        plugin.on_shutdown()